@@ -3,13 +3,13 @@ import logging
 # from jwt import PyJWTError
 from typing import List
 
-from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Response
 
 from app.api import utils
 from app.crud import company as crud
 from app.db.mongo import AsyncIOMotorClient as DBClient
 from app.db.mongo import get_database
-from app.models.base import UserModel
+from app.models.base import UserModel, model_projection
 from app.models.user import UserBase, UserInDB
 from app.models.company import (
     BaseModel, Contact,
@@ -29,8 +29,11 @@ client = Depends(get_database)
 summary="Read companies",
 response_model=List[Company])
 async def read_companies(
+    response: Response,
     limit: int=50,
     skip: int=0,
+    cursor: str=None,
+    fields: str=None,
     db: DBClient=client,
     # current_user: UserInDB=Depends(get_current_user)
     ):
@@ -39,8 +42,9 @@ async def read_companies(
     # context = current_user['context']
     # Filter by user context
     filter = {}
-    companies = await crud.get_multi_by_filer(db, filter, limit, skip)
-    return companies
+    companies = await crud.get_multi_by_filer(db, filter, limit, skip, cursor,
+        model_projection(Company, fields))
+    return utils.page_response(response, companies, fields)
     # return utils.create_aliased_response(
     #     ManyCompaniesResponse(response=companies, count=len(companies))
     # )
@@ -50,8 +54,11 @@ async def read_companies(
 summary="Read companies by license",
 response_model=List[Company])
 async def read_companies_by_license(
+    response: Response,
     limit: int=50,
     skip: int=0,
+    cursor: str=None,
+    fields: str=None,
     db: DBClient=client,
     current_user: UserInDB=Depends(get_current_user)
     ):
@@ -60,8 +67,9 @@ async def read_companies_by_license(
     context = current_user['context']
     # Filter by user context
     filter = {"created_by": context}
-    companies = await crud.get_multi_by_filer(db, filter, limit, skip)
-    return companies
+    companies = await crud.get_multi_by_filer(db, filter, limit, skip, cursor,
+        model_projection(Company, fields))
+    return utils.page_response(response, companies, fields)
     # return utils.create_aliased_response(
     #     ManyCompaniesResponse(response=companies, count=len(companies))
     # )
@@ -87,7 +95,7 @@ async def create_company(
 async def read_company(ref: str, db: DBClient=client):
     """Read company info"""
     logging.info(f">>> {__name__}:{read_company.__name__}")
-    company = await crud.get(db, ref)
+    company = await crud.get(db, ref, model_projection(Company))
     if company:
         return utils.create_aliased_response(CompanyResponse(response=company))
     return utils.create_404_response()
@@ -97,13 +105,10 @@ async def read_company(ref: str, db: DBClient=client):
 async def update_company(ref: str, data: CompanyUpdate, db: DBClient=client):
     """Update company info"""
     logging.info(f">>> {__name__}:{update_company.__name__}")
-    found = await crud.get(db, ref)
-    if not found:
+    rs = await crud.update(db, ref, data)
+    if not rs.found:
         return utils.create_404_response()
-    company = await crud.update(db, found["_id"], data)
-    if company:
-        return utils.create_aliased_response(CompanyResponse(response=company))
-    return utils.create_422_response()
+    return utils.create_aliased_response(CompanyResponse(response=rs.doc))
 
 
 @router.post("/companies/{ref}/add-contacts", response_model=List[Contact])
@@ -1,21 +1,39 @@
+import csv
+import io
+import json
 import logging
+import zlib
 from time import time
 from random import shuffle
-from typing import List
+from typing import Dict, List
 
-from fastapi import APIRouter, Body, Depends
+from fastapi import APIRouter, Body, Depends, HTTPException
 from bson.objectid import ObjectId
+from starlette.responses import StreamingResponse
+from starlette.status import WS_1008_POLICY_VIOLATION
+from starlette.websockets import WebSocket, WebSocketDisconnect
 
 from app.api import utils
-from app.core.config import DOCTYPE_EV_GPQ, DOCTYPE_PERSONA, GPQ_TOTAL_ITEMS
+from app.api.security import (ProjectLoader, get_current_persona,
+                              get_current_superuser, get_current_user)
+from app.core.config import (DOCTYPE_EV_GPQ, DOCTYPE_PERSONA,
+                             GPQ_ITEMS_VERSION, GPQ_TOTAL_ITEMS,
+                             USERTYPE_GAIA, USERTYPE_LICENSE,
+                             USERTYPE_PERSONA)
 from app.crud.utils import get_by_dict, get_collection
 from app.crud import gpq as crud
 from app.crud.persona import get as get_persona, update_progress
+from app.db.itembank import get_bank, resolve_rows
 from app.db.mongo import AsyncIOMotorClient as DBClient, get_database
-from app.models.pev.gpq import (
-    GPQEvidence, GPQEvidenceResponse, ManyGPQEvidencesResponse, GPQRow
+from app.models.evidence.gpq import (
+    GPQAnswers, GPQEvidence, GPQEvidenceResponse, ManyGPQEvidencesResponse,
+    GPQRow, record_rows
 )
+from app.models.base import model_projection
 from app.models.persona import Progress
+from app.scoring.gpq import gpq_scorer
+from app.scoring.norms import SCOPES, gpq_norms
+from app.scoring.timing import gpq_timing
 
 
 router = APIRouter()
@@ -37,18 +55,78 @@ client = Depends(get_database)
 # /gpq/id/init          called when entering GPQ
 # /gpq/id/start         called when starting workbook
 # /gpq/id/update        called when sending answer
+# /gpq/id/submit        called when sending queued answers
+# /gpq/id/resume        called after reconnecting, unanswered rows only
+# /gpq/ws               the above over one socket, for personas
+# /gpq/me/...           the above, evidence taken from the persona token
 # /gpq/id/finish        called when finishing workbook
+# /gpq/norms/percentiles  raw element scores to percentiles
 
 
 
+async def persona_evidence(db: DBClient = client,
+current_user: dict = Depends(get_current_persona)):
+    """Evidence of the token's persona: its `context` and `username`"""
+    id = await crud.ensure_evidence(
+        db, current_user["context"], current_user["username"]
+    )
+    if not id:
+        raise HTTPException(status_code=404, detail="Persona not found")
+    return id
+
+
+async def resolve_evidence(id: str = None, prj_id: str = None,
+username: str = None, db: DBClient = client,
+current_user: dict = Depends(get_current_persona)):
+    """
+    Evidence of the token's persona. Clients may still send its `id`, or
+    `prj_id` + `username`, which must then name that same evidence.
+    """
+    own = await persona_evidence(db, current_user)
+    if (id and id != own) or \
+        (prj_id and prj_id != current_user["context"]) or \
+        (username and username != current_user["username"]):
+        raise HTTPException(status_code=403, detail="Not your evidence")
+    return own
+
+
+async def managed_project(prj_id: str, current_user: dict):
+    """The project, when `current_user` manages it"""
+    return await ProjectLoader(manager=True)(prj_id, current_user)
+
+
+def evidence_rows(ev: dict):
+    """Records as row dicts, statements of option answers from the bank"""
+    bank = get_bank("GPQ", ev.get("version") or GPQ_ITEMS_VERSION)
+    return resolve_rows(record_rows(ev.get("records")), bank)
+
+
+def evidences_response(evidences: list, fields: str = None):
+    for ev in evidences:
+        if "records" in ev:
+            ev["records"] = evidence_rows(ev)
+    if fields:
+        return utils.create_projected_response(
+            {"response": evidences, "count": len(evidences)}
+        )
+    return utils.create_aliased_response(
+        ManyGPQEvidencesResponse(response=evidences, count=len(evidences))
+    )
+
+
 @router.get("/gpq",
 summary="Read evidences",
 response_model=List[GPQEvidence])
-async def read_evidences(limit: int=50, skip: int=0, db: DBClient=client):
+async def read_evidences(
+    limit: int=50, skip: int=0, cursor: str=None, fields: str=None,
+    db: DBClient=client,
+    current_user: dict=Depends(get_current_superuser)
+    ):
     logging.info(f">>> {__name__}:{read_evidences.__name__}")
-    evidences = await crud.get_multi(db, limit, skip)
-    return utils.create_aliased_response(
-        ManyGPQEvidencesResponse(response=evidences, count=len(evidences))
+    evidences = await crud.get_multi(db, limit, skip, cursor,
+        model_projection(GPQEvidence, fields))
+    return utils.set_next_cursor(
+        evidences_response(evidences, fields), evidences
     )
 
 
@@ -56,17 +134,144 @@ async def read_evidences(limit: int=50, skip: int=0, db: DBClient=client):
 summary="Read evidences by project",
 response_model=List[GPQEvidence])
 async def read_by_project(
-    id: str, limit: int=50, skip: int=0, db: DBClient=client
+    id: str, limit: int=50, skip: int=0, cursor: str=None, fields: str=None,
+    project: dict=Depends(ProjectLoader(staff=True)),
+    db: DBClient=client
     ):
     logging.info(f">>> {__name__}:{read_by_project.__name__}")
     if not ObjectId.is_valid(id):
         return utils.create_422_response("Invalid ObjectId")
-    evidences = await crud.get_by_project(db, id, limit, skip)
-    return utils.create_aliased_response(
-        ManyGPQEvidencesResponse(response=evidences, count=len(evidences))
+    evidences = await crud.get_by_project(db, id, limit, skip, cursor,
+        model_projection(GPQEvidence, fields))
+    return utils.set_next_cursor(
+        evidences_response(evidences, fields), evidences
+    )
+
+
+EXPORT_EVIDENCE_COLUMNS = [
+    "username", "fullname", "initiated", "started", "stopped", "touched"
+]
+EXPORT_RECORD_COLUMNS = [
+    "seq", "wb_seq", "option", "element", "statement", "saved", "elapsed"
+]
+
+
+def export_columns(columns: str = None):
+    """Split the `columns` query into evidence and record columns"""
+    names = EXPORT_EVIDENCE_COLUMNS + EXPORT_RECORD_COLUMNS
+    if columns:
+        names = [x.strip() for x in columns.split(",") if x.strip() in names] \
+            or names
+    return (
+        [x for x in names if x in EXPORT_EVIDENCE_COLUMNS],
+        [x for x in names if x in EXPORT_RECORD_COLUMNS]
+    )
+
+
+async def export_lines(evidences, format: str, ev_cols: list, rec_cols: list):
+    """One chunk per evidence: its CSV rows, or one NDJSON line"""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(ev_cols + rec_cols)
+        yield buffer.getvalue()
+        async for ev in evidences:
+            buffer.seek(0)
+            buffer.truncate()
+            head = [ev.get(x) for x in ev_cols]
+            rows = evidence_rows(ev) if rec_cols else []
+            if not rows:
+                writer.writerow(head)
+            for row in rows:
+                writer.writerow(head + [row.get(x) for x in rec_cols])
+            yield buffer.getvalue()
+    else:
+        async for ev in evidences:
+            line = {x: ev.get(x) for x in ev_cols}
+            if rec_cols:
+                line["records"] = [
+                    {x: row.get(x) for x in rec_cols}
+                    for row in evidence_rows(ev)
+                ]
+            yield json.dumps(line, default=str) + "\n"
+
+
+async def gzipped(chunks):
+    stream = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = stream.compress(chunk.encode())
+        if data:
+            yield data
+    yield stream.flush()
+
+
+@router.get("/gpq/by-project/{id}/export",
+summary="Export project evidences")
+async def export_by_project(
+    id: str, format: str="csv", columns: str=None, gzip: bool=False,
+    db: DBClient=client,
+    project: dict=Depends(ProjectLoader(staff=True))
+    ):
+    """
+    Streams `csv` (one line per record) or `ndjson` (one line per
+    evidence). `columns` picks from the evidence fields and the record
+    fields, e.g. `username,seq,element,elapsed`.
+    """
+    logging.info(f">>> {__name__}:{export_by_project.__name__}")
+    if not ObjectId.is_valid(id):
+        return utils.create_422_response("Invalid ObjectId")
+    if format not in ("csv", "ndjson"):
+        return utils.create_422_response("Format must be csv or ndjson")
+    ev_cols, rec_cols = export_columns(columns)
+    projection = {"_id": 0, "version": 1}
+    for x in ev_cols:
+        projection[x] = 1
+    for x in rec_cols:
+        projection["records." + x] = 1
+    if "statement" in rec_cols:
+        projection["records.wb_seq"] = 1
+        projection["records.option"] = 1
+
+    evidences = crud.iter_by_project(db, id, projection)
+    body = export_lines(evidences, format, ev_cols, rec_cols)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"gpq-{id}.{format}"
+    if gzip:
+        body = gzipped(body)
+        media_type = "application/gzip"
+        filename += ".gz"
+    return StreamingResponse(
+        body, media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 
+@router.get("/gpq/by-project/{id}/scores",
+summary="Score project evidences")
+async def read_project_scores(id: str, db: DBClient=client,
+project: dict=Depends(ProjectLoader(staff=True))):
+    """Element tallies and response-time features per persona"""
+    logging.info(f">>> {__name__}:{read_project_scores.__name__}")
+    if not ObjectId.is_valid(id):
+        return utils.create_422_response("Invalid ObjectId")
+    scores = await gpq_scorer.score_project(db, id)
+    return { "response": scores, "count": len(scores) }
+
+
+@router.get("/gpq/by-project/{id}/timing",
+summary="Response times per item")
+async def read_project_timing(id: str, db: DBClient=client,
+project: dict=Depends(ProjectLoader(staff=True))):
+    """
+    p50/p90/p99 answer time (ms) per item and for the whole project, and
+    the personas currently flagged as rushed, slow or stalled.
+    """
+    logging.info(f">>> {__name__}:{read_project_timing.__name__}")
+    if not ObjectId.is_valid(id):
+        return utils.create_422_response("Invalid ObjectId")
+    return { "response": await gpq_timing.report(db, id) }
+
+
 # {
 #   "prj_id": "5e870e7d4c789fb7d8301909",
 #   "username": "persona4",
@@ -80,9 +285,11 @@ async def create(
     prj_id: str = Body(...),
     username: str = Body(...),
     rows: int = Body(GPQ_TOTAL_ITEMS),
-    db: DBClient = client):
+    db: DBClient = client,
+    current_user: dict = Depends(get_current_user)):
 
     logging.info(f">>> {__name__}:{create.__name__}")
+    await managed_project(prj_id, current_user)
     collection = get_collection(db, DOCTYPE_PERSONA)
     persona = await get_by_dict(collection, {
         "prj_id": ObjectId(prj_id),
@@ -103,11 +310,9 @@ async def create(
     )
 
 
-# This should depend on current persona
-
 @router.post("/gpq/init",
 summary="Start session")
-async def init(id: str, db: DBClient = client):
+async def init(id: str = Depends(resolve_evidence), db: DBClient = client):
     rs = await crud.init(db, id)
     if not rs:
         return utils.create_500_response("GPQ update-init failed")
@@ -116,18 +321,23 @@ async def init(id: str, db: DBClient = client):
 
 @router.post("/gpq/start",
 summary="Start working on workbook")
-async def start(id: str, db: DBClient = client):
+async def start(id: str = Depends(resolve_evidence), db: DBClient = client):
     rs = await crud.start(db, id)
     if not rs:
         return utils.create_500_response("GPQ update-start failed")
     return { "response": rs }
 
+# {
+#   "seq": 4,
+#   "wb_seq": 99,
+#   "option": 1
+# }
+# or, without an item bank,
 # {
 #   "seq": 4,
 #   "wb_seq": 99,
 #   "element": "SN",
-#   "statement": "Manjaring datang jurang",
-#   "last_touch": 1586143502687
+#   "statement": "Manjaring datang jurang"
 # }
 # {
 #   "response": {
@@ -138,16 +348,248 @@ async def start(id: str, db: DBClient = client):
 @router.post("/gpq/update",
 summary="Save answer")
 async def update(
-    id: str,
+    id: str = Depends(resolve_evidence),
     seq: int = Body(...),
     wb_seq: int = Body(...),
-    element: str = Body(...),
-    statement: str = Body(...),
+    option: int = Body(None),
+    element: str = Body(None),
+    statement: str = Body(None),
     db: DBClient = client
     ):
-    rs = await crud.update(db, id, seq, wb_seq, element, statement)
+    if option is None and not element:
+        return utils.create_422_response("Give option, or element and statement")
+    try:
+        rs = await crud.update(db, id, seq, wb_seq, element, statement, option)
+    except ValueError as e:
+        return utils.create_422_response(str(e))
     if not rs:
         return utils.create_500_response("GPQ update-start failed")
     return { "response": rs }
 
 
+# {
+#   "since": 1586143502687,
+#   "rows": [
+#     {"seq": 4, "wb_seq": 99, "option": 1, "saved": 1586143509211},
+#     {"seq": 5, "wb_seq": 12, "option": 0, "saved": 1586143514002}
+#   ]
+# }
+
+@router.post("/gpq/submit",
+summary="Save queued answers")
+async def submit(data: GPQAnswers, id: str = Depends(resolve_evidence),
+db: DBClient = client):
+    """Safe to replay: the same rows always produce the same records"""
+    logging.info(f">>> {__name__}:{submit.__name__}")
+    try:
+        rs = await crud.submit(db, id, data)
+    except ValueError as e:
+        return utils.create_422_response(str(e))
+    if not rs:
+        return utils.create_500_response("GPQ submit failed")
+    return { "response": rs }
+
+
+# {
+#   "response": {
+#     "initiated": 1586143490211,
+#     "started": 1586143502687,
+#     "touched": 1586143514002,
+#     "remaining": [{"seq": 6, "wb_seq": 105}, {"seq": 7, "wb_seq": 31}, ...]
+#   }
+# }
+
+@router.get("/gpq/resume",
+summary="Session state and unanswered rows")
+async def resume(id: str = Depends(resolve_evidence), db: DBClient = client):
+    logging.info(f">>> {__name__}:{resume.__name__}")
+    rs = await crud.resume(db, id)
+    if not rs:
+        return utils.create_404_response("GPQ evidence not found")
+    return { "response": rs }
+
+
+@router.post("/gpq/finish",
+summary="Finish workbook")
+async def finish(id: str = Depends(resolve_evidence), db: DBClient = client):
+    """Stops the evidence and adds its element scores to the norms"""
+    logging.info(f">>> {__name__}:{finish.__name__}")
+    rs = await crud.finish(db, id)
+    if not rs:
+        return utils.create_422_response("Evidence not found or already finished")
+    return { "response": rs }
+
+
+""" PERSONA: /gpq/me, the evidence comes from the access token """
+
+@router.post("/gpq/me/init",
+summary="Start own session")
+async def init_mine(id: str = Depends(persona_evidence), db: DBClient = client):
+    return await init(id=id, db=db)
+
+
+@router.post("/gpq/me/start",
+summary="Start working on own workbook")
+async def start_mine(id: str = Depends(persona_evidence), db: DBClient = client):
+    return await start(id=id, db=db)
+
+
+@router.post("/gpq/me/update",
+summary="Save own answer")
+async def update_mine(
+    id: str = Depends(persona_evidence),
+    seq: int = Body(...),
+    wb_seq: int = Body(...),
+    option: int = Body(None),
+    element: str = Body(None),
+    statement: str = Body(None),
+    db: DBClient = client
+    ):
+    return await update(id=id, seq=seq, wb_seq=wb_seq, option=option,
+        element=element, statement=statement, db=db)
+
+
+@router.post("/gpq/me/submit",
+summary="Save own queued answers")
+async def submit_mine(data: GPQAnswers, id: str = Depends(persona_evidence),
+db: DBClient = client):
+    return await submit(data=data, id=id, db=db)
+
+
+@router.get("/gpq/me/resume",
+summary="Own session state and unanswered rows")
+async def resume_mine(id: str = Depends(persona_evidence), db: DBClient = client):
+    return await resume(id=id, db=db)
+
+
+@router.post("/gpq/me/finish",
+summary="Finish own workbook")
+async def finish_mine(id: str = Depends(persona_evidence), db: DBClient = client):
+    return await finish(id=id, db=db)
+
+
+# {"SN": 14, "PA": 9, "EX": 21, ...}
+
+@router.post("/gpq/norms/percentiles",
+summary="Percentiles of a GPQ profile")
+async def read_percentiles(
+    profile: Dict[str, int],
+    scope: str = "global",
+    key: str = None,
+    db: DBClient = client,
+    current_user: dict = Depends(get_current_user)
+    ):
+    """
+    Mid-rank percentile of every element score among the finished
+    personas of a `project` or `company` (`key` is its id), or `global`.
+    Project norms are for its staff, company norms for Gaia and licensee
+    users, global norms for anyone but personas.
+    """
+    logging.info(f">>> {__name__}:{read_percentiles.__name__}")
+    if scope not in SCOPES:
+        return utils.create_422_response("Scope must be project, company or global")
+    if scope != "global" and not key:
+        return utils.create_422_response("Give the key of the scope")
+    if current_user["scope"] == USERTYPE_PERSONA:
+        raise HTTPException(status_code=403, detail="Not allowed for personas")
+    if scope == "project":
+        await ProjectLoader(staff=True)(key, current_user)
+    elif scope == "company" and \
+        current_user["scope"] not in (USERTYPE_GAIA, USERTYPE_LICENSE):
+        raise HTTPException(status_code=403, detail="Not allowed")
+    table = await gpq_norms.get_table(db, scope, key)
+    return { "response": table.percentiles(profile), "count": table.count }
+
+
+@router.post("/gpq/compact",
+summary="Store finished evidence in compact layout")
+async def compact(id: str, db: DBClient = client,
+current_user: dict = Depends(get_current_user)):
+    """For the manager of the evidence's project"""
+    logging.info(f">>> {__name__}:{compact.__name__}")
+    if not ObjectId.is_valid(id):
+        return utils.create_422_response("Invalid ObjectId")
+    ev = await crud.get(db, id, {"_id": 0, "prj_id": 1})
+    if not ev:
+        return utils.create_404_response("GPQ evidence not found")
+    await managed_project(str(ev["prj_id"]), current_user)
+    rs = await crud.compact(db, id)
+    if not rs:
+        return utils.create_422_response("Evidence is not finished or already compact")
+    return { "response": rs }
+
+
+"""
+GPQ session over one WebSocket: `/gpq/ws?token=<persona access token>`.
+The token is checked once, the evidence comes from its context and
+username. Every message is JSON with a `type`, replies echo `ref`.
+
+    -> {"type": "start"}
+    -> {"type": "answer", "seq": 4, "wb_seq": 99, "option": 1}
+    -> {"type": "answers", "since": 1586143502687, "rows": [...]}
+    -> {"type": "progress", "progress": {"state": "working", ...}}
+    -> {"type": "resume"}
+    -> {"type": "finish"}
+    -> {"type": "heartbeat"}
+    <- {"type": "ready" | "ack" | "heartbeat" | "error", ...}
+"""
+
+async def handle_message(db: DBClient, id: str, user: dict, msg: dict):
+    kind = msg.get("type")
+    if kind == "heartbeat":
+        return {"type": "heartbeat", "ts": round(time() * 1000)}
+    if kind == "start":
+        rs = await crud.start(db, id)
+    elif kind == "answer":
+        rs = await crud.update(
+            db, id, msg["seq"], msg["wb_seq"], msg.get("element"),
+            msg.get("statement"), msg.get("option")
+        )
+    elif kind == "answers":
+        rs = await crud.submit(db, id, GPQAnswers(**msg))
+    elif kind == "resume":
+        rs = await crud.resume(db, id)
+    elif kind == "finish":
+        rs = await crud.finish(db, id)
+    elif kind == "progress":
+        rs = await update_progress(
+            db, user["context"], user["username"],
+            Progress(**msg["progress"]).dict()
+        )
+    else:
+        return {"type": "error", "detail": "Unknown message type"}
+    if not rs:
+        return {"type": "error", "detail": "GPQ " + kind + " failed"}
+    return {"type": "ack", "response": rs}
+
+
+@router.websocket("/gpq/ws")
+async def session_socket(websocket: WebSocket, token: str):
+    try:
+        user = await get_current_user(token)
+    except HTTPException:
+        user = None
+    if not user or user["scope"] != USERTYPE_PERSONA:
+        await websocket.close(code=WS_1008_POLICY_VIOLATION)
+        return
+    db = get_database()
+    id = await crud.ensure_evidence(db, user["context"], user["username"])
+    if not id:
+        await websocket.close(code=WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    rs = await crud.init(db, id)
+    await websocket.send_json({"type": "ready", "id": id, "response": rs})
+    try:
+        while True:
+            msg = await websocket.receive_json()
+            try:
+                reply = await handle_message(db, id, user, msg)
+            except (KeyError, TypeError, ValueError) as e:
+                reply = {"type": "error", "detail": "Invalid message: " + str(e)}
+            if "ref" in msg:
+                reply["ref"] = msg["ref"]
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        logging.info(f"GPQ socket closed for {user['username']}")
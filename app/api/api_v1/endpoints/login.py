@@ -6,13 +6,13 @@ from fastapi import APIRouter, Body, Depends, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm as OAuth2Form
 
-from app.api.security import get_current_user
+from app.api.security import get_current_profile
 from app.core.config import (ACCESS_TOKEN_EXPIRE_MINUTES, DOCTYPE_PERSONA,
                              DOCTYPE_PROJECT, DOCTYPE_USER, USERTYPE_CLIENT,
                              USERTYPE_EXPERT, USERTYPE_GAIA, USERTYPE_LICENSE,
                              USERTYPE_PERSONA)
-from app.core.jwt import create_access_token
-from app.core.security import get_password_hash
+from app.core.jwt import create_access_token, principal_claims
+from app.core.security import hasher
 from app.crud import user as crud
 from app.crud.persona import authenticate_persona
 from app.crud.project import authenticate_member
@@ -140,11 +140,7 @@ async def jwt_login(form_data: dict, db: DBClient=client):
         "username": user['username'],
         "fullname": user['fullname'],
         "access_token": create_access_token(
-            data = {
-                "username": user['username'],
-                "scope": scope,
-                "context": context
-            },
+            data = principal_claims(user, scope, context),
             expires_delta=access_token_expires
         ),
         "token_type": "bearer"
@@ -222,11 +218,7 @@ async def login2(form_data: OAuth2Form=Depends(), db: DBClient=client):
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     return {
       "access_token": create_access_token(
-          data = {
-              "username": user['username'],
-              "scope": scope,
-              "context": context
-          },
+          data = principal_claims(user, scope, context),
           expires_delta=access_token_expires
       ),
       "token_type": "bearer",
@@ -336,11 +328,7 @@ async def login(form_data: OAuth2Form=Depends(), db: DBClient=client):
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     return {
       "access_token": create_access_token(
-          data = {
-              "username": user['username'],
-              "scope": scope,
-              "context": context
-          },
+          data = principal_claims(user, scope, context),
           expires_delta=access_token_expires
       ),
       "token_type": "bearer",
@@ -356,7 +344,7 @@ async def login(form_data: OAuth2Form=Depends(), db: DBClient=client):
 
 
 @router.post("/test-token", response_model=UserWithContext)
-async def test_token(current_user: UserWithContext = Depends(get_current_user)):
+async def test_token(current_user: UserWithContext = Depends(get_current_profile)):
     """
     Test access token.
     """
@@ -409,8 +397,8 @@ async def reset_password(token: str = Body(...), new_password: str = Body(...)):
     #     raise HTTPException(status_code=400, detail="Inactive user")
     # user_in = UserUpdate(name=username, password=new_password)
     # user = crud.user.update(bucket, username=username, user_in=user_in)
-    logging.info("FULL NAME: " + user['full_name'])
-    hashed_password = get_password_hash(password=new_password)
+    logging.info("FULL NAME: " + str(user.get('fullname')))
+    hashed_password = await hasher.hash(new_password)
     collection = get_collection(db, DOCTYPE_USER)
     rs = await collection.update_one(
         {"username": username},
@@ -420,5 +408,7 @@ async def reset_password(token: str = Body(...), new_password: str = Body(...)):
             }
         }
     )
+    # Tokens issued with the old password stop working
+    await crud.revoke_tokens(db, username)
 
     return {"msg": "Password updated successfully"}
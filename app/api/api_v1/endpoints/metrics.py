@@ -0,0 +1,32 @@
+import logging
+
+from fastapi import APIRouter, Depends
+
+from app.api.security import get_current_superuser
+from app.core.security import hasher
+from app.db.mongo import AsyncIOMotorClient as DBClient
+from app.db.mongo import get_database, index_report
+from app.models.user import UserInDB
+
+router = APIRouter()
+
+client = Depends(get_database)
+
+
+@router.get("/metrics/hashing",
+summary="Read password hashing metrics")
+async def read_hashing_metrics(
+    current_user: UserInDB=Depends(get_current_superuser)):
+    """Queue depth and latency (ms) of the bcrypt pool in this worker"""
+    logging.info(f">>> {__name__}:{read_hashing_metrics.__name__}")
+    return {"response": hasher.metrics()}
+
+
+@router.get("/metrics/indexes",
+summary="Read index report")
+async def read_index_report(
+    db: DBClient=client,
+    current_user: UserInDB=Depends(get_current_superuser)):
+    """Missing, undeclared, redundant and unused indexes per collection"""
+    logging.info(f">>> {__name__}:{read_index_report.__name__}")
+    return {"response": await index_report(db)}
@@ -6,7 +6,7 @@ from fastapi import APIRouter, Depends
 
 from app.api import utils
 from app.core.config import DOCTYPE_PROJECT
-from app.core.security import get_password_hash
+from app.core.security import hasher
 from app.crud import persona as crud
 from app.crud.project import get as get_project
 from app.db.mongo import AsyncIOMotorClient as DBClient
@@ -54,7 +54,7 @@ async def create_persona(prj_id: str, data: PersonaCreate, db: DBClient=client):
     if not project:
         return utils.create_422_response("Could not find the referred project")
 
-    hashed_pwd = get_password_hash(data.password)
+    hashed_pwd = await hasher.hash(data.password)
     _dict = data.dict()
     _dict["prj_id"] = prj_id
     _dict["hashed_password"] = hashed_pwd
@@ -90,11 +90,7 @@ async def read_persona(ref: str, db: DBClient=client):
 async def update_persona(ref: str, data: PersonaUpdate, db: DBClient=client):
     """Update persona info"""
     logging.info(f">>> {__name__}:{update_persona.__name__}")
-    persona = await crud.get(db, ref)
-    if not persona:
+    rs = await crud.update(db, ref, data)
+    if not rs.found:
         return utils.create_404_response()
-
-    updated = await crud.update(db, persona["_id"], data)
-    if updated:
-        return utils.create_aliased_response(PersonaResponse(response=updated))
-    return utils.create_422_response()
+    return utils.create_aliased_response(PersonaResponse(response=rs.doc))
@@ -1,21 +1,27 @@
+import asyncio
+import json
 import logging
 import random
 from typing import Any, List
 
 from bson.objectid import ObjectId
-from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Response
 from fastapi.encoders import jsonable_encoder
 from motor.motor_asyncio import AsyncIOMotorCollection as Collection
 from pydantic import BaseModel, EmailStr
 from pymongo import ReturnDocument
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
 
 from app.api import utils
-from app.api.security import (get_current_project_creator,
+from app.api.security import (ProjectLoader, get_current_project_creator,
                               get_current_project_manager, get_current_user)
 from app.core.config import (DATA_PAGING_DEFAULT, DOCTYPE_COMPANY,
-                             DOCTYPE_PERSONA, DOCTYPE_PROJECT, USERTYPE_CLIENT,
+                             DOCTYPE_PERSONA, DOCTYPE_PROJECT, FEED_HEARTBEAT,
+                             FEED_INTERVAL_MS, USERTYPE_CLIENT,
                              USERTYPE_EXPERT)
-from app.core.security import get_password_hash
+from app.core.events import progress_bus
+from app.core.security import hasher
 from app.crud import project as crud
 from app.crud.company import get as get_company
 from app.crud.persona import create as create_persona
@@ -25,13 +31,15 @@ from app.crud.persona import get_multi_filtered as get_multi_filtered_personas
 from app.crud.utils import get_collection
 from app.db.mongo import AsyncIOMotorClient as DBClient
 from app.db.mongo import get_database
-from app.models.base import Workbook
+from app.db.presence import presence
+from app.models.base import Workbook, model_projection
 from app.models.batch import (Batch, BatchBase, BatchCreate, FacetimeSession,
                               WorkbookSession)
 from app.models.persona import (Persona, PersonaCreate, PersonaInDB,
                                 PersonaInfo, ProjectPersona)
-from app.models.project import (Guest, GuestCreate, Project, ProjectBase,
-                                ProjectCreate, ProjectInfo, ProjectUpdate)
+from app.models.project import (Guest, GuestCreate, GuestUpdate, Project,
+                                ProjectBase, ProjectCreate, ProjectInfo,
+                                ProjectUpdate)
 from app.models.user import UserBase, UserInApp, UserInDB
 
 router = APIRouter()
@@ -39,33 +47,48 @@ router = APIRouter()
 client = Depends(get_database)
 
 
+def raise_module_exists(where: str = "project"):
+    raise HTTPException(
+        status_code=400,
+        detail="The module with given type already exists in " + where + "."
+    )
+
+
 @router.get("/all",
 summary="Read all projects",
 response_model=List[Project])
 async def read_all_projects(
+    response: Response,
     limit: int=50,
     skip: int=0,
+    cursor: str=None,
+    fields: str=None,
     db: DBClient=client):
-    """Read projects"""
+    """Read projects, `fields` narrows the returned fields (e.g. `title`)"""
     logging.info(f">>> {__name__}:{read_project.__name__}")
     # filter = {'owner': current_user['context']}
-    projects = await crud.get_multi(db, limit, skip)
-    return projects
+    projects = await crud.get_multi(db, limit, skip, cursor,
+        model_projection(Project, fields))
+    return utils.page_response(response, projects, fields)
 
 
 @router.get("",
 summary="Read projects",
 response_model=List[Project])
 async def read_projects(
+    response: Response,
     limit: int=50,
     skip: int=0,
+    cursor: str=None,
+    fields: str=None,
     db: DBClient=client,
     current_user: UserInDB=Depends(get_current_project_creator)):
-    """Read projects"""
+    """Read projects, `fields` narrows the returned fields (e.g. `title`)"""
     logging.info(f">>> {__name__}:{read_project.__name__}")
     filter = {'owner': current_user['context']}
-    projects = await crud.get_multi_by_filter(db, filter, limit, skip)
-    return projects
+    projects = await crud.get_multi_by_filter(db, filter, limit, skip, cursor,
+        model_projection(Project, fields))
+    return utils.page_response(response, projects, fields)
 
 
 @router.post("",
@@ -97,19 +120,11 @@ response_model=Project)
 async def read_project(
     id: str,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_user)):
+    project: dict=Depends(ProjectLoader(*model_projection(Project)))):
     """Read project info"""
     logging.info(f">>> {__name__}:{read_projects.__name__}")
 
-    is_member = await crud.is_project_member(db, current_user, id)
-    if not is_member:
-        utils.raise_not_member()
-
-    project = await crud.get(db, id)
-    if project:
-        return project
-
-    return utils.create_404_response()
+    return project
 
 
 """ CLIENTS """
@@ -120,14 +135,10 @@ response_model=List[Guest])
 async def read_clients(
     id: str,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_user)):
+    project: dict=Depends(ProjectLoader("members"))):
     logging.info(f">>> {__name__}:{read_clients.__name__}")
 
-    is_member = await crud.is_project_member(db, current_user, id)
-    if not is_member:
-        utils.raise_not_member()
-
-    return await crud.get_members(db, id, USERTYPE_CLIENT)
+    return crud.filter_members(project, USERTYPE_CLIENT)
 
 
 @router.post("/{id}/clients", # add-client
@@ -137,60 +148,55 @@ async def add_client(
     id: str,
     data: GuestCreate,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     """Add client to project.
 
     **TODO**: Email notification
     """
     logging.info(f">>> {__name__}:{add_client.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
-    free = await crud.check_free_member_slot(db, id, data.email, data.username)
-    print("FREE: {}", free)
-    if not free:
-        return utils.error_400_response("Email or username already registered in project.")
     added = await crud.add_member(db, id, USERTYPE_CLIENT, data)
-    print(added)
-    if added:
-        return utils.create_aliased_response(
-            {"response": Guest(**added)}
-        )
-    return utils.create_aliased_response({"response": None})
+    if not added:
+        return utils.error_400_response("Email or username already registered in project.")
+    return utils.create_aliased_response({"response": Guest(**added)})
 
 
 @router.put("/{id}/clients", # edit-client
-summary="[TODO] Edit project client",
+summary="Edit project client",
 response_model=Guest)
 async def edit_client(
     id: str,
     username: str,
+    data: GuestUpdate,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
+    """Changing the password or disabling revokes the client's tokens"""
+    logging.info(f">>> {__name__}:{edit_client.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
-    return None
+    rs = await crud.update_member(db, id, USERTYPE_CLIENT, username, data)
+    if not rs:
+        return utils.create_404_response("Client not found")
+    return utils.create_aliased_response({"response": Guest(**rs)})
 
 
 @router.delete("/{id}/clients", # delete-client
-summary="[TODO] Delete project client",
+summary="Delete project client",
 response_model=Guest)
 async def delete_client(
     id: str,
     username: str,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
+    """Also revokes the client's tokens"""
+    logging.info(f">>> {__name__}:{delete_client.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
-    return None
+    rs = await crud.remove_member(db, id, USERTYPE_CLIENT, username)
+    if not rs:
+        return utils.create_404_response("Client not found")
+    return utils.create_aliased_response({"response": Guest(**rs)})
 
 
 """ EXPERTS """
@@ -201,14 +207,10 @@ response_model=List[Guest])
 async def read_experts(
     id: str,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_user)):
+    project: dict=Depends(ProjectLoader("members"))):
     logging.info(f">>> {__name__}:{read_clients.__name__}")
 
-    is_member = await crud.is_project_member(db, current_user, id)
-    if not is_member:
-        utils.raise_not_member()
-
-    return await crud.get_members(db, id, USERTYPE_EXPERT)
+    return crud.filter_members(project, USERTYPE_EXPERT)
 
 
 @router.post("/{id}/experts",
@@ -217,60 +219,55 @@ async def add_expert(
     id: str,
     data: GuestCreate,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     """Add expert to project.
 
     **TODO**: Email notification
     """
     logging.info(f">>> {__name__}:{add_client.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
-    free = await crud.check_free_member_slot(db, id, data.email, data.username)
-    print("FREE: {}", free)
-    if not free:
-        return utils.error_400_response("Email or username already registered in project.")
     added = await crud.add_member(db, id, USERTYPE_EXPERT, data)
-    print(added)
-    if added:
-        return utils.create_aliased_response(
-            {"response": Guest(**added)}
-        )
-    return utils.create_aliased_response({"response": None})
+    if not added:
+        return utils.error_400_response("Email or username already registered in project.")
+    return utils.create_aliased_response({"response": Guest(**added)})
 
 
 @router.put("/{id}/experts",
-summary="[TODO] Edit project expert",
+summary="Edit project expert",
 response_model=Guest)
 async def edit_expert(
     id: str,
     username: str,
+    data: GuestUpdate,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
+    """Changing the password or disabling revokes the expert's tokens"""
+    logging.info(f">>> {__name__}:{edit_expert.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
-    return None
+    rs = await crud.update_member(db, id, USERTYPE_EXPERT, username, data)
+    if not rs:
+        return utils.create_404_response("Expert not found")
+    return utils.create_aliased_response({"response": Guest(**rs)})
 
 
 @router.delete("/{id}/experts",
-summary="[TODO] Delete project expert",
+summary="Delete project expert",
 response_model=Guest)
 async def delete_expert(
     id: str,
     username: str,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
+    """Also revokes the expert's tokens"""
+    logging.info(f">>> {__name__}:{delete_expert.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
-    return None
+    rs = await crud.remove_member(db, id, USERTYPE_EXPERT, username)
+    if not rs:
+        return utils.create_404_response("Expert not found")
+    return utils.create_aliased_response({"response": Guest(**rs)})
 
 
 """ PERSONA """
@@ -279,21 +276,21 @@ async def delete_expert(
 response_model=List[Persona])
 async def read_project_personas(
     id: str,
+    response: Response,
     limit: int = DATA_PAGING_DEFAULT,
     skip: int = 0,
+    cursor: str = None,
+    fields: str = None,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_user)):
+    project: dict=Depends(ProjectLoader())):
     """
     Read project personas.
     """
     logging.info(f">>> {__name__}:{read_project_personas.__name__}")
 
-    is_member = await crud.is_project_member(db, current_user, id)
-    if not is_member:
-        utils.raise_not_member()
-
-    personas = await get_multi_filtered_personas(db, {"prj_id": ObjectId(id)}, limit, skip)
-    return personas
+    personas = await get_multi_filtered_personas(db, {"prj_id": ObjectId(id)},
+        limit, skip, cursor, model_projection(Persona, fields))
+    return utils.page_response(response, personas, fields)
 
 
 @router.post("/{id}/personas",
@@ -303,20 +300,17 @@ async def add_persona(id: str,
     username: str = Body(...),
     email: EmailStr = Body(...),
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     """
     Create project persona.
     """
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
     f1 = username[:3]
     f2 = str(ObjectId())[20:]
     f2 = ''.join(random.sample(f2, len(f2)))
     password = f1 + f2
-    hashed_password = get_password_hash(password)
+    hashed_password = await hasher.hash(password)
     persona = PersonaInDB(
         prj_id = ObjectId(id),
         license = 'gaia',
@@ -340,11 +334,8 @@ async def edit_persona(
     user_id: str,
     info: PersonaInfo,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
-
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
 
     return None
 
@@ -356,11 +347,8 @@ async def delete_persona(
     id: str,
     user_id: str,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
-
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
 
     return None
 
@@ -373,14 +361,10 @@ response_model=List[Workbook])
 async def read_modules(
     id: str,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_user)):
+    project: dict=Depends(ProjectLoader("workbooks", "facetimes"))):
     logging.info(f">>> {__name__}:{read_modules.__name__}")
 
-    is_member = await crud.is_project_member(db, current_user, id)
-    if not is_member:
-        utils.raise_not_member()
-
-    return await crud.get_modules(db, id)
+    return crud.select_modules(project)
 
 
 @router.get("/{id}/workbooks",
@@ -389,14 +373,10 @@ response_model=List[Workbook])
 async def read_workbooks(
     id: str,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_user)):
+    project: dict=Depends(ProjectLoader("workbooks"))):
     logging.info(f">>> {__name__}:{read_workbooks.__name__}")
 
-    is_member = await crud.is_project_member(db, current_user, id)
-    if not is_member:
-        utils.raise_not_member()
-
-    return await crud.get_modules(db, id, "workbook")
+    return crud.select_modules(project, "workbook")
 
 
 @router.post("/{id}/workbooks",
@@ -406,29 +386,14 @@ async def add_workbook(
     id: str,
     data: Workbook,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     """Add workbook module to project"""
     logging.info(f">>> {__name__}:{add_workbook.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
-    collection = get_collection(db, DOCTYPE_PROJECT)
-    found = await collection.find_one(
-        {
-            "_id": ObjectId(id),
-            "workbooks.type": data.type
-        },
-        {"_id": 0, "workbooks.$": 1}
-    )
-    print(found)
-    if found:
-        raise HTTPException(
-            status_code=400,
-            detail="The module with given type already exists in project."
-        )
     rs = await crud.add_module(db, id, data, False)
+    if not rs:
+        raise_module_exists()
     return rs
 
 
@@ -441,13 +406,10 @@ async def edit_workbook(id: str, type: str,
     items: int=Body(...),
     uri: str=Body(...),
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     logging.info(f">>> {__name__}:{edit_workbook.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
     info = {
         'type': type,
         'version': version,
@@ -465,14 +427,11 @@ async def delete_workbook(
     id: str,
     type: str,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     """Return list of workbooks after deletion."""
     logging.info(f">>> {__name__}:{delete_workbook.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
     return await crud.delete_workbook(db, id, type)
 
 
@@ -482,14 +441,10 @@ response_model=List[Workbook])
 async def read_facetimes(
     id: str,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_user)):
+    project: dict=Depends(ProjectLoader("facetimes"))):
     logging.info(f">>> {__name__}:{read_facetimes.__name__}")
 
-    is_member = await crud.is_project_member(db, current_user, id)
-    if not is_member:
-        utils.raise_not_member()
-
-    return await crud.get_modules(db, id, "facetime")
+    return crud.select_modules(project, "facetime")
 
 
 @router.post("/{id}/facetimes",
@@ -499,29 +454,14 @@ async def add_facetime(
     id: str,
     data: Workbook,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     """Add facetime module to project"""
     logging.info(f">>> {__name__}:{add_facetime.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
-    collection = get_collection(db, DOCTYPE_PROJECT)
-    found = await collection.find_one(
-        {
-            "_id": ObjectId(id),
-            "facetimes.type": data.type
-        },
-        {"_id": 0, "facetimes.$": 1}
-    )
-    print(found)
-    if found:
-        raise HTTPException(
-            status_code=400,
-            detail="The module with given type already exists in project."
-        )
     rs = await crud.add_module(db, id, data, True)
+    if not rs:
+        raise_module_exists()
     return rs
 
 
@@ -534,13 +474,10 @@ async def edit_facetime(id: str, type: str,
     items: int=Body(...),
     uri: str=Body(...),
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     logging.info(f">>> {__name__}:{edit_facetime.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
     info = {
         'type': type,
         'version': version,
@@ -558,14 +495,11 @@ async def delete_facetime(
     id: str,
     type: str,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     """Return list of facetimes after deletion."""
     logging.info(f">>> {__name__}:{delete_facetime.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
     return await crud.delete_facetime(db, id, type)
 
 
@@ -596,28 +530,106 @@ response_model=List[Batch])
 async def read_batches(
     id: str,
     db: DBClient=client,
-    current_user: UserInApp=Depends(get_current_user)):
+    project: dict=Depends(ProjectLoader("batches"))):
     """Read project batches."""
     logging.info(f">>> {__name__}:{read_batches.__name__}")
 
-    is_member = await crud.is_project_member(db, current_user, id)
-    if not is_member:
-        utils.raise_not_member()
+    return project.get('batches', [])
+
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def batch_feed(request: Request, db: DBClient, id: str,
+participants: List[str]):
+    """
+    A snapshot of the batch, then its changes coalesced per persona and
+    sent at most once per FEED_INTERVAL_MS. Subscribes before the snapshot
+    is read, so no change falls in between.
+    """
+    members = set(participants)
+    with progress_bus.subscribe(id) as sub:
+        yield sse("snapshot", await presence.batch(db, id, participants))
+
+        while not await request.is_disconnected():
+            events = await sub.next_events(FEED_HEARTBEAT)
+            if not events:
+                yield ": ping\n\n"
+                continue
+            await asyncio.sleep(FEED_INTERVAL_MS / 1000)
+            events += await sub.next_events(0)
+            deltas = {}
+            for event in events:
+                if event["username"] not in members:
+                    continue
+                delta = deltas.setdefault(event["username"], {})
+                for key, value in event.items():
+                    if isinstance(value, dict):
+                        delta.setdefault(key, {}).update(value)
+                    else:
+                        delta[key] = value
+            if deltas:
+                yield sse("progress", list(deltas.values()))
+
+
+@router.get("/{id}/batches/{batch_id}/feed",
+summary="Live progress of batch personas (Server-Sent Events)")
+async def read_batch_feed(
+    id: str,
+    batch_id: str,
+    request: Request,
+    db: DBClient=client,
+    project: dict=Depends(ProjectLoader("batches", staff=True))):
+    """
+    `snapshot` with the batch presence summary, then `progress` events
+    with only what changed.
+    """
+    logging.info(f">>> {__name__}:{read_batch_feed.__name__}")
+    batch = crud.find_batch(project, batch_id)
+    if not batch:
+        return utils.create_404_response("Batch not found")
+    return StreamingResponse(
+        batch_feed(request, db, id, batch.get("participants", [])),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
-    return await crud.get_batches(db, id)
+@router.get("/{id}/batches/{batch_id}/presence",
+summary="Who is online, on which item, who has stalled")
+async def read_batch_presence(
+    id: str,
+    batch_id: str,
+    db: DBClient=client,
+    project: dict=Depends(ProjectLoader("batches", staff=True))):
+    """Served from the in-memory presence index"""
+    logging.info(f">>> {__name__}:{read_batch_presence.__name__}")
+    batch = crud.find_batch(project, batch_id)
+    if not batch:
+        return utils.create_404_response("Batch not found")
+    return await presence.batch(db, id, batch.get("participants", []))
+
+
+@router.get("/{id}/personas/{username}/presence",
+summary="Presence of one persona")
+async def read_persona_presence(
+    id: str,
+    username: str,
+    db: DBClient=client,
+    project: dict=Depends(ProjectLoader(staff=True))):
+    logging.info(f">>> {__name__}:{read_persona_presence.__name__}")
+    return await presence.persona(db, id, username)
 
 
 @router.post("/{id}/create-batch",
 response_model=Batch)
 async def create_batch(id: str, data: BatchCreate, db: DBClient = client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     """Create batch for group of participants"""
     logging.info(f">>> {__name__}:{create_batch.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
     rs = await crud.create_batch(db=db, id=id, data=data)
     # return {"response": rs}
     return rs
@@ -627,31 +639,16 @@ async def create_batch(id: str, data: BatchCreate, db: DBClient = client,
 response_model=WorkbookSession)
 async def add_workbook_session(id: str, batch_id: str, data: WorkbookSession,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader("batches.batch_id", manager=True))):
     """Add workbook session to batch"""
     logging.info(f">>> {__name__}:{add_workbook_session.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
-    # Check if module is already there
-    collection = get_collection(db, DOCTYPE_PROJECT)
-    found = await collection.find_one(
-        {
-            "_id": ObjectId(id),
-            "batches.batch_id": batch_id,
-            "batches.workbook_sessions.module": data.module
-        },
-        {"_id": 0, "batches": {"$elemMatch": {"batch_id": batch_id}}}
-    )
-    # print(found)
-    if found:
-        raise HTTPException(
-            status_code=400,
-            detail="The module with given type already exists in the batch."
-        )
+    if not crud.find_batch(project, batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
     rs = await crud.add_workbook_session(db, id, batch_id, data)
+    if not rs:
+        raise_module_exists("the batch")
     return rs
 
 
@@ -659,31 +656,16 @@ async def add_workbook_session(id: str, batch_id: str, data: WorkbookSession,
 response_model=FacetimeSession)
 async def add_facetime_session(id: str, batch_id: str, data: FacetimeSession,
     db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader("batches.batch_id", manager=True))):
     """Add facetime session to batch"""
     logging.info(f">>> {__name__}:{add_facetime_session.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
-    # Check if module is already there
-    collection = get_collection(db, DOCTYPE_PROJECT)
-    found = await collection.find_one(
-        {
-            "_id": ObjectId(id),
-            "batches.batch_id": batch_id,
-            "batches.facetime_sessions.module": data.module
-        },
-        {"_id": 0, "batches": {"$elemMatch": {"batch_id": batch_id}}}
-    )
-    if found:
-        raise HTTPException(
-            status_code=400,
-            detail="The module with given type already exists in the batch."
-        )
-
+    if not crud.find_batch(project, batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
     rs = await crud.add_facetime_session(db, id, batch_id, data)
+    if not rs:
+        raise_module_exists("the batch")
     return rs
 
 
@@ -693,13 +675,14 @@ async def add_personas(id: str, data: List[PersonaCreate], db: DBClient=client):
     [NOT COMPLETED]"""
     logging.info(f">>> {__name__}:{add_personas.__name__}")
     docs = []
-    for p in data:
+    hashes = await hasher.hash_many([p.password for p in data])
+    for p, hashed_password in zip(data, hashes):
         _dict = p.dict()
         del _dict["password"]
         dic = {
             "prj_id": ObjectId(id),
             **_dict,
-            "hashed_password": get_password_hash(p.password)
+            "hashed_password": hashed_password
         }
         docs.append(dic)
     _ids = await create_personas(db, docs)
@@ -712,14 +695,11 @@ async def add_personas(id: str, data: List[PersonaCreate], db: DBClient=client):
 @router.put("/{id}/prepare-batteries",
 summary="Prepare persona batteries")
 async def prepare_batteries(id: str, batch_id: str, db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     """Update persona data to match batch project"""
     logging.info(f">>> {__name__}:{prepare_batteries.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
     rs = await crud.prepare_persona_batteries(db, id, batch_id)
     return rs
 
@@ -727,13 +707,10 @@ async def prepare_batteries(id: str, batch_id: str, db: DBClient=client,
 @router.put("/{id}/prepare-evidences",
 summary="Prepare persona evidences")
 async def prepare_evidences(id: str, batch_id: str, db: DBClient=client,
-    current_user: UserInDB=Depends(get_current_project_manager)):
+    current_user: UserInDB=Depends(get_current_project_manager),
+    project: dict=Depends(ProjectLoader(manager=True))):
     """Create persona evidence templates"""
     logging.info(f">>> {__name__}:{prepare_evidences.__name__}")
 
-    is_manager = await crud.is_project_manager(db, current_user, id)
-    if not is_manager:
-        utils.raise_not_manager()
-
     rs = await crud.prepare_persona_evidences(db, id, batch_id)
     return rs
@@ -1,7 +1,7 @@
 import logging
 from typing import Any, List
 
-from fastapi import APIRouter, Body, Depends
+from fastapi import APIRouter, Body, Depends, Response
 from pydantic import EmailStr
 
 from app.api import utils
@@ -10,11 +10,13 @@ from app.crud import user as crud
 from app.api.security import (
     get_current_user,
     get_current_active_user,
+    get_current_profile,
     get_current_superuser,
     get_current_project_creator
 )
 from app.db.mongo import AsyncIOMotorClient as DBClient
 from app.db.mongo import get_database
+from app.models.base import model_projection
 from app.models.user import (
     ManyUsersResponse, User, UserBase, UserInDB, UserCreate, UserResponse, UserUpdate,
     UserWithContext
@@ -28,14 +30,22 @@ client = Depends(get_database)
 
 @router.get("/users", response_model=List[User])
 async def read_users(
+    response: Response,
     limit: int = 50,
     skip: int=0,
+    cursor: str = None,
+    fields: str = None,
     db: DBClient=client,
     current_user: UserInDB=Depends(get_current_active_user)
     ):
+    """
+    Pass the `X-Next-Cursor` response header as `cursor` for the next page.
+    `fields` is a comma separated list of fields to return.
+    """
     logging.info(">>> " + __name__ + ":" + read_users.__name__ )
-    users = await crud.get_multi(db, limit, skip)
-    return users
+    users = await crud.get_multi(db, limit, skip, cursor,
+        model_projection(User, fields))
+    return utils.page_response(response, users, fields)
     # return utils.create_aliased_response(
     #     ManyUsersResponse(response=users, count=len(users))
     # )
@@ -92,7 +102,7 @@ async def create_license(data: UserCreate, db: DBClient=client):
 
 
 @router.get("/users/me", response_model=UserWithContext)
-async def read_user_me(current_user: UserInDB=Depends(get_current_active_user)):
+async def read_user_me(current_user: UserInDB=Depends(get_current_profile)):
     """
     Get current user.
     """
@@ -105,7 +115,7 @@ async def update_user_me(
     password: str = Body(None),
     fullname: str = Body(None),
     email: EmailStr = Body(None),
-    current_user: UserInDB = Depends(get_current_active_user),
+    current_user: UserInDB = Depends(get_current_profile),
     db: DBClient=client
 ):
     """
@@ -119,9 +129,9 @@ async def update_user_me(
         user_in.fullname = fullname
     if user_in.email is not None:
         user_in.email = email
-    user = await crud.update(db, current_user["_id"], user_in)
-    if user:
-        return utils.create_aliased_response(UserResponse(response=user))
+    rs = await crud.update(db, current_user["_id"], user_in)
+    if rs.found:
+        return utils.create_aliased_response(UserResponse(response=rs.doc))
     return utils.create_404_response()
 
 
@@ -143,7 +153,7 @@ async def update_user(ref: str, data: UserUpdate, db: DBClient=client):
     if not user:
         return utils.create_404_response()
 
-    user = await crud.update(db, user["_id"], data)
-    if user:
-        return utils.create_aliased_response(UserResponse(response=user))
+    rs = await crud.update(db, user["_id"], data)
+    if rs.found:
+        return utils.create_aliased_response(UserResponse(response=rs.doc))
     return utils.create_404_response()
@@ -1,5 +1,6 @@
 import jwt
 import logging
+from time import time
 
 from fastapi import HTTPException, Security
 from fastapi.security import OAuth2PasswordBearer
@@ -13,14 +14,17 @@ from app.core.config import USERTYPE_LICENSE
 from app.core.config import USERTYPE_CLIENT
 from app.core.config import USERTYPE_EXPERT
 from app.core.config import USERTYPE_PERSONA
-from app.core.config import SECRET_KEY
+from app.core.config import SECRET_KEY, TOKEN_VERSION_TTL
 from app.core.config import DOCTYPE_PERSONA, DOCTYPE_PROJECT, DOCTYPE_USER
-from app.core.jwt import ALGORITHM
+from app.core.jwt import ALGORITHM, remember_token_version, token_versions
 from app.db.mongo import get_database
 # from app.models.context import ProjectContext
+from app.api.utils import raise_not_manager, raise_not_member
+from app.models.role import mask_to_roles
 from app.models.token import TokenPayload
 from app.models.user import User, UserInApp, UserInDB
-from app.crud.project import get_project_member
+from app.crud.project import (get_project_member, is_manager_of,
+                              is_member_of, load as load_project)
 from app.crud.utils import get_collection
 
 
@@ -38,6 +42,52 @@ reuseable_oauth2 = OAuth2PasswordBearer(
     }
 )
 
+
+def raise_revoked():
+    raise HTTPException(
+        status_code=HTTP_403_FORBIDDEN,
+        detail="Token has been revoked"
+    )
+
+
+async def load_principal(db, scope: str, context: str, username: str,
+projection: dict = None):
+    """Read the principal behind a token from its home collection"""
+    if scope == USERTYPE_PERSONA:
+        collection = get_collection(db, DOCTYPE_PERSONA)
+        return await collection.find_one({
+            "username": username,
+            "prj_id": ObjectId(context)
+        }, projection)
+    elif (scope == USERTYPE_CLIENT or scope == USERTYPE_EXPERT):
+        return await get_project_member(db, context, username)
+    collection = get_collection(db, DOCTYPE_USER)
+    return await collection.find_one({"username": username}, projection)
+
+
+async def check_token_version(token_data: TokenPayload):
+    """
+    Compare the token's `ver` claim with the principal's `token_version`.
+    The stored version is re-read at most once per TOKEN_VERSION_TTL per
+    principal and worker, so the common case never touches Mongo.
+    """
+    key = (token_data.scope, token_data.context, token_data.username)
+    cached = token_versions.get(key)
+    if cached and time() - cached[1] < TOKEN_VERSION_TTL:
+        version = cached[0]
+    else:
+        db = get_database()
+        principal = await load_principal(
+            db, *key, {"_id": 0, "token_version": 1}
+        )
+        if not principal:
+            raise HTTPException(status_code=404, detail="User not found")
+        version = principal.get("token_version", 0)
+        remember_token_version(*key, version)
+    if version != token_data.ver:
+        raise_revoked()
+
+
 async def get_current_user(token: str = Security(reuseable_oauth2)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -47,32 +97,42 @@ async def get_current_user(token: str = Security(reuseable_oauth2)):
             status_code=HTTP_403_FORBIDDEN,
             detail="Could not validate credentials"
         )
-    db = get_database()
+    scope = token_data.scope
+
+    # Tokens carrying the principal snapshot skip the database
+    if token_data.ver is not None:
+        await check_token_version(token_data)
+        user = {
+            "_id": token_data.id,
+            "username": token_data.username,
+            "fullname": token_data.fullname,
+            "email": token_data.email,
+            "type": token_data.type,
+            "disabled": token_data.disabled,
+            "admin_roles": mask_to_roles(token_data.roles),
+            "context": token_data.context,
+            "scope": scope
+        }
+        if not (scope == USERTYPE_GAIA or scope == USERTYPE_LICENSE):
+            user['admin_roles'] = []
+        return user
 
     # ? CAN'T USE -> user = crud.user.get(db, username=token_data.username)
     logging.info("USERNAME : " + token_data.username)
     logging.info("SCOPE: " + token_data.scope)
     logging.info("CONTEXT: " + token_data.context)
-    scope = token_data.scope
-    if scope == USERTYPE_PERSONA:
-        collection = get_collection(db, DOCTYPE_PERSONA)
-        user = await collection.find_one({
-            "username": token_data.username,
-            "prj_id": ObjectId(token_data.context)
-        })
-    elif (scope == USERTYPE_CLIENT or scope == USERTYPE_EXPERT):
-        collection = get_collection(db, DOCTYPE_PROJECT)
-        user = await get_project_member(db, token_data.context, token_data.username)
-    else:
-        collection = get_collection(db, DOCTYPE_USER)
-        user = await collection.find_one({"username": token_data.username})
+    db = get_database()
+    user = await load_principal(
+        db, scope, token_data.context, token_data.username
+    )
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
 
     user["context"] = token_data.context
+    user["scope"] = scope
     if not (scope == USERTYPE_GAIA or scope == USERTYPE_LICENSE):
         user['admin_roles'] = []
     logging.info(token_data.context)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
@@ -82,6 +142,24 @@ async def get_current_active_user(current_user: UserInApp = Security(get_current
     return current_user
 
 
+async def get_current_profile(
+current_user: UserInApp = Security(get_current_active_user)):
+    """
+    The token's principal as stored, for routes that return profile
+    fields. Tokens carrying claims only hold what access checks need.
+    """
+    user = await load_principal(
+        get_database(), current_user["scope"], current_user["context"],
+        current_user["username"]
+    )
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user["context"] = current_user["context"]
+    user["scope"] = current_user["scope"]
+    user["admin_roles"] = current_user["admin_roles"]
+    return user
+
+
 async def get_current_superuser(current_user: UserInApp = Security(get_current_user)):
     if not crud.user.is_superuser(current_user):
         raise HTTPException(
@@ -114,3 +192,52 @@ current_user: UserInApp = Security(get_current_user)):
             status_code=400, detail="The user doesn't have project manager privileges"
         )
     return current_user
+
+
+async def get_current_persona(
+current_user: UserInApp = Security(get_current_user)):
+    if current_user["scope"] != USERTYPE_PERSONA:
+        raise HTTPException(
+            status_code=400, detail="The user is not a persona"
+        )
+    return current_user
+
+
+class ProjectLoader:
+    """
+    Dependency that reads the `{id}` project once per request.
+
+    Only `lead_by` and the `fields` the route declares are fetched, or
+    the whole document with `full=True`. The manager/member check is
+    answered from that document and the document is handed to the handler.
+    With `staff=True` the project's personas are not members.
+    """
+
+    def __init__(self, *fields: str, manager: bool = False, full: bool = False,
+    staff: bool = False):
+        self.projection = None
+        if not full:
+            self.projection = {"lead_by": 1}
+            for field in fields:
+                self.projection[field] = 1
+        self.manager = manager
+        self.staff = staff
+
+    async def __call__(self, id: str,
+    current_user: UserInApp = Security(get_current_user)):
+        if not ObjectId.is_valid(id):
+            raise HTTPException(status_code=422, detail="Invalid ObjectId")
+        project = await load_project(get_database(), id, self.projection)
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+        if self.manager:
+            if not is_manager_of(project, current_user):
+                raise_not_manager()
+        elif not is_member_of(project, current_user):
+            raise_not_member()
+        elif self.staff and current_user["scope"] == USERTYPE_PERSONA:
+            raise HTTPException(
+                status_code=HTTP_403_FORBIDDEN,
+                detail="Not available to project personas"
+            )
+        return project
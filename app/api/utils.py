@@ -1,7 +1,10 @@
+from bson.objectid import ObjectId
 from pydantic import BaseModel
 from fastapi import HTTPException
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 
 
 def raise_not_manager():
@@ -18,6 +21,31 @@ def raise_not_member():
     )
 
 
+def set_next_cursor(response: Response, rows: list):
+    """Expose the continuation token of a crud page as a response header"""
+    next_cursor = getattr(rows, "next_cursor", None)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+
+
+def create_projected_response(content) -> JSONResponse:
+    """Partial documents (`fields=`) skip response-model validation"""
+    return JSONResponse(
+        content=jsonable_encoder(content, custom_encoder={ObjectId: str})
+    )
+
+
+def page_response(response: Response, rows: list, fields: str = None):
+    """Return a crud page from a list endpoint, with its cursor header"""
+    if fields:
+        response = create_projected_response(rows)
+    set_next_cursor(response, rows)
+    if fields:
+        return response
+    return rows
+
+
 def create_aliased_response(model: BaseModel) -> JSONResponse:
     return JSONResponse(content=jsonable_encoder(model, by_alias=True))
 
@@ -7,6 +7,8 @@ API_V1_STR = "/api/v1"
 SECRET_KEY = "PATIKANJI"
 # ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 1  # 60 minutes * 24 hours * 1 day = 1 day
 ACCESS_TOKEN_EXPIRE_MINUTES = 24 * 60 # 24 x 60 minutes
+# Seconds a worker trusts a principal's token_version before re-reading it
+TOKEN_VERSION_TTL = int(os.getenv("TOKEN_VERSION_TTL", 60))
 
 SERVER_NAME = os.getenv("SERVER_NAME")
 SERVER_HOST = os.getenv("SERVER_HOST")
@@ -19,9 +21,45 @@ BACKEND_CORS_ORIGINS = "http://localhost, http://localhost:8000, http://localhos
 MAX_CONNECTIONS_COUNT = int(os.getenv("MAX_CONNECTIONS_COUNT", 100))
 MIN_CONNECTIONS_COUNT = int(os.getenv("MIN_CONNECTIONS_COUNT", 10))
 
+# bcrypt pool per worker, 0 = use the default thread pool
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", 2))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", 256))
+
+# GPQ session state: "memory" (per worker) or "redis" (shared, needs aioredis)
+GPQ_SESSION_STORE = os.getenv("GPQ_SESSION_STORE", "memory")
+GPQ_SESSION_TTL = int(os.getenv("GPQ_SESSION_TTL", 4 * 3600))
+GPQ_SESSION_MAXSIZE = int(os.getenv("GPQ_SESSION_MAXSIZE", 10000))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost")
+
+# GPQ answer saves: "direct" (one update per answer), or write-behind with
+# "buffered" (ack once queued) or "flushed" (ack once the batch is written)
+GPQ_WRITE_MODE = os.getenv("GPQ_WRITE_MODE", "direct")
+GPQ_FLUSH_ROWS = int(os.getenv("GPQ_FLUSH_ROWS", 200))
+GPQ_FLUSH_MS = int(os.getenv("GPQ_FLUSH_MS", 50))
+
+# GPQ scoring pool, 0 = use the default thread pool
+GPQ_SCORING_WORKERS = int(os.getenv("GPQ_SCORING_WORKERS", 2))
+GPQ_SCORING_CHUNK = int(os.getenv("GPQ_SCORING_CHUNK", 1000))
+GPQ_SCORING_CACHE = int(os.getenv("GPQ_SCORING_CACHE", 50000))
+
+# Documents per Motor batch when streaming exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 200))
+
+# Live progress feeds: events kept per slow subscriber, coalescing window
+# of the deltas and seconds between keep-alive comments when idle
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", 1000))
+FEED_INTERVAL_MS = int(os.getenv("FEED_INTERVAL_MS", 1000))
+FEED_HEARTBEAT = int(os.getenv("FEED_HEARTBEAT", 15))
+
+# Presence index: a persona is online when touched within PRESENCE_ONLINE_MS,
+# at most PRESENCE_MAX_PROJECTS projects are kept in memory
+PRESENCE_ONLINE_MS = int(os.getenv("PRESENCE_ONLINE_MS", 2 * 60 * 1000))
+PRESENCE_MAX_PROJECTS = int(os.getenv("PRESENCE_MAX_PROJECTS", 1000))
+
 MONGODB_URI = os.getenv("MONGODB_URI")
 MONGODB_NAME = os.getenv("MONGODB_NAME")
 
+DOCTYPE_META            = "meta"
 DOCTYPE_TEST            = "tests"
 DOCTYPE_USER            = "users"
 DOCTYPE_PERSONA         = "personas"
@@ -32,6 +70,8 @@ DOCTYPE_EV_GATE         = "ev_gate"
 DOCTYPE_EV_MATE         = "ev_mate"
 DOCTYPE_EV_GPQ          = "ev_gpq"
 DOCTYPE_EV_SJT          = "ev_sjt"
+DOCTYPE_GPQ_TIMING      = "gpq_timing"
+DOCTYPE_GPQ_NORMS       = "gpq_norms"
 
 COMPANY_SYMBOL_LENGTH   = 6
 USERNAME_MIN_LENGTH     = 5
@@ -64,6 +104,21 @@ ROLE_PROJECT_MANAGER    = "project-manager"
 ROLE_PROJECT_MEMBER     = "project-member"
 
 GPQ_TOTAL_ITEMS         = 120
+# Part of the seed of every persona's GPQ item order
+GPQ_ITEMS_VERSION = os.getenv("GPQ_ITEMS_VERSION", "1")
+# Seconds a worker reuses a GPQ norm table before re-reading it, which
+# bounds how stale other workers' percentiles get
+GPQ_NORMS_CACHE_TTL = int(os.getenv("GPQ_NORMS_CACHE_TTL", 60))
+# Item bank files, `<type>-<version>.bank`, see app.db.itembank
+ITEM_BANK_DIR = os.getenv("ITEM_BANK_DIR", "./app/items")
+
+# Response-time flags: "rushed" when at least GPQ_RUSH_SHARE of (at least
+# GPQ_RUSH_MIN_ANSWERS) answers took under GPQ_RUSH_MS, "stalled" when an
+# unfinished persona has not answered for GPQ_STALL_MS
+GPQ_RUSH_MS = int(os.getenv("GPQ_RUSH_MS", 1500))
+GPQ_RUSH_SHARE = float(os.getenv("GPQ_RUSH_SHARE", 0.3))
+GPQ_RUSH_MIN_ANSWERS = int(os.getenv("GPQ_RUSH_MIN_ANSWERS", 10))
+GPQ_STALL_MS = int(os.getenv("GPQ_STALL_MS", 5 * 60 * 1000))
 
 
 # FIRST_SUPERUSER = os.getenv("FIRST_SUPERUSER")
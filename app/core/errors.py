@@ -8,7 +8,8 @@ from fastapi.openapi.utils import (
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
 from starlette.responses import JSONResponse
-from starlette.status import HTTP_422_UNPROCESSABLE_ENTITY
+from starlette.status import (HTTP_422_UNPROCESSABLE_ENTITY,
+                              HTTP_503_SERVICE_UNAVAILABLE)
 
 
 async def http_error_handler(
@@ -46,6 +47,18 @@ async def http_422_error_handler(
     )
 
 
+async def hash_queue_full_handler(
+    request: Request,
+    exc: Exception
+) -> JSONResponse:
+    """Password hashing is saturated, ask the client to retry later"""
+    return JSONResponse(
+        {"error": str(exc), "response": None},
+        status_code=HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"}
+    )
+
+
 validation_error_definition["properties"] = {
     "body": {"title": "Body", "type": "array", "items": {"type": "string"}}
 }
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from app.core import config
+
+
+class Subscription:
+    """One subscriber's bounded queue, see `EventBus.subscribe`"""
+
+    def __init__(self, bus: "EventBus", topic: str, maxsize: int):
+        self.bus = bus
+        self.topic = topic
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, event: Dict):
+        # A slow subscriber loses its oldest events, publishers never wait
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def next_events(self, timeout: float) -> List[Dict]:
+        """Wait up to `timeout` seconds for an event, then take all queued"""
+        events = []
+        if self.queue.empty():
+            try:
+                events.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                return []
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """
+    In-process fan-out of small event dicts to every subscriber of a
+    topic. Events only reach subscribers of the same worker.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._listeners = []
+
+    def subscribe(self, topic: str) -> Subscription:
+        sub = Subscription(self, topic, self.queue_size)
+        self._subscribers[topic].add(sub)
+        logging.info(f"Feed subscribed to {topic} ({len(self._subscribers[topic])})")
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        subs = self._subscribers.get(sub.topic)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self._subscribers[sub.topic]
+
+    def add_listener(self, fn: Callable[[str, Dict], None]):
+        """Call `fn(topic, event)` for every event, synchronously"""
+        self._listeners.append(fn)
+
+    def publish(self, topic: str, event: Dict):
+        for fn in self._listeners:
+            fn(topic, event)
+        for sub in self._subscribers.get(topic, ()):
+            sub.put(event)
+
+
+# Topic is the project id, events carry `username` plus changed fields
+progress_bus = EventBus(config.FEED_QUEUE_SIZE)
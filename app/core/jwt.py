@@ -1,12 +1,18 @@
 from datetime import datetime, timedelta
+from time import time
+from typing import Dict, Tuple
 
 import jwt
 
 from app.core.config import SECRET_KEY
+from app.models.role import roles_to_mask
 
 ALGORITHM = "HS256"
 access_token_jwt_subject = "access"
 
+# (scope, context, username) -> (token_version, checked_at)
+token_versions: Dict[Tuple[str, str, str], Tuple[int, float]] = {}
+
 
 def create_access_token(*, data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -18,3 +24,35 @@ def create_access_token(*, data: dict, expires_delta: timedelta = None):
     to_encode.update({"exp": expire, "sub": access_token_jwt_subject})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+
+def principal_claims(user: dict, scope: str, context: str):
+    """
+    Snapshot of the authenticated principal carried inside the token,
+    so `get_current_user` can authorize without reading Mongo.
+    `ver` must match the principal's `token_version` in the database.
+    """
+    return {
+        "username": user['username'],
+        "scope": scope,
+        "context": context,
+        "id": str(user['_id']),
+        "fullname": user.get('fullname'),
+        "email": user.get('email'),
+        "type": user.get('type', scope),
+        "roles": roles_to_mask(user.get('admin_roles')),
+        "disabled": bool(user.get('disabled', False)),
+        "ver": user.get('token_version', 0),
+    }
+
+
+def remember_token_version(scope: str, context: str, username: str,
+version: int):
+    token_versions[(scope, context, username)] = (version, time())
+
+
+def forget_token_version(username: str, context: str = None):
+    """Drop cached versions so this worker re-reads them on next use"""
+    for key in list(token_versions):
+        if key[2] == username and (context is None or key[1] == context):
+            token_versions.pop(key, None)
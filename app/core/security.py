@@ -1,5 +1,12 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
 from passlib.context import CryptContext
 
+from app.core import config
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
@@ -9,3 +16,93 @@ def verify_password(plain_password: str, hashed_password: str):
 
 def get_password_hash(password: str):
     return pwd_context.hash(password)
+
+
+class HashQueueFull(Exception):
+    """Raised when too many hash jobs are already waiting for a worker."""
+    pass
+
+
+class HashingService:
+    """
+    Runs bcrypt off the event loop.
+
+    `workers` > 0 uses a process pool of that size, 0 falls back to the
+    loop's default thread pool (bcrypt releases the GIL). At most
+    `queue_size` jobs may wait for a free worker; beyond that callers
+    get `HashQueueFull` instead of stalling the loop.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = None
+        self._pending = 0
+        self._rejected = 0
+        self._count = 0
+        self._total_ms = 0.0
+        self._max_ms = 0.0
+        self._last_ms = 0.0
+
+    def _get_executor(self):
+        if self._executor is None and self.workers > 0:
+            logging.info(f"Starting hash pool with {self.workers} workers")
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _run(self, fn, *args):
+        slots = max(self.workers, 1)
+        if self._pending - slots >= self.queue_size:
+            self._rejected += 1
+            raise HashQueueFull("Password hashing queue is full")
+        self._pending += 1
+        start = perf_counter()
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+            elapsed = (perf_counter() - start) * 1000
+            self._count += 1
+            self._total_ms += elapsed
+            self._last_ms = elapsed
+            if elapsed > self._max_ms:
+                self._max_ms = elapsed
+
+    async def verify(self, plain_password: str, hashed_password: str):
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str):
+        return await self._run(get_password_hash, password)
+
+    async def hash_many(self, passwords):
+        """Hash in worker-sized chunks so bulk imports don't fill the queue."""
+        slots = max(self.workers, 1)
+        hashes = []
+        for i in range(0, len(passwords), slots):
+            chunk = passwords[i:i + slots]
+            hashes += await asyncio.gather(*[self.hash(p) for p in chunk])
+        return hashes
+
+    def metrics(self):
+        slots = max(self.workers, 1)
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": min(self._pending, slots),
+            "queue_depth": max(self._pending - slots, 0),
+            "rejected": self._rejected,
+            "count": self._count,
+            "avg_ms": round(self._total_ms / self._count, 2) if self._count else 0,
+            "max_ms": round(self._max_ms, 2),
+            "last_ms": round(self._last_ms, 2),
+        }
+
+    async def shutdown(self):
+        if self._executor is not None:
+            logging.info("Shutting down hash pool...")
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hasher = HashingService(config.HASH_POOL_WORKERS, config.HASH_QUEUE_SIZE)
@@ -10,25 +10,29 @@ from app.crud import utils
 from app.db.mongo import AsyncIOMotorClient as DBClient
 from app.models.company import CompanyBase, Contact
 
-async def get(db: DBClient, ref: str):
+async def get(db: DBClient, ref: str, projection: dict = None):
     logging.info(f">>> {__name__}:{get.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_COMPANY)
     if ObjectId.is_valid(ref):
-        return await utils.get(collection, ref)
-    return await utils.get(collection, ref.upper(), "symbol")
+        return await utils.get(collection, ref, projection=projection)
+    return await utils.get(collection, ref.upper(), "symbol", projection)
 
 
-async def get_multi(db: DBClient, limit: int, skip: int):
+async def get_multi(db: DBClient, limit: int, skip: int, cursor: str = None,
+projection: dict = None):
     logging.info(f">>> {__name__}:{get_multi.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_COMPANY)
-    return await utils.get_multi(collection, limit, skip)
+    return await utils.get_multi(collection, limit, skip, cursor,
+        projection=projection)
 
 
-async def get_multi_by_filer(db: DBClient, filter: Dict, limit: int, skip: int):
+async def get_multi_by_filer(db: DBClient, filter: Dict, limit: int, skip: int,
+cursor: str = None, projection: dict = None):
     logging.info(f">>> {__name__}:{get_multi.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_COMPANY)
     # filter
-    return await utils.get_multi_by_filter(collection, filter, limit, skip)
+    return await utils.get_multi_by_filter(collection, filter, limit, skip,
+        cursor, projection=projection)
 
 
 async def create(db: DBClient, data: CompanyBase):
@@ -37,10 +41,13 @@ async def create(db: DBClient, data: CompanyBase):
     return await utils.create(collection, data)
 
 
-async def update(db: DBClient, id: str, data: CompanyBase):
+async def update(db: DBClient, ref: str, data: CompanyBase):
+    """`ref` is the company id or symbol, returns a `WriteResult`"""
     logging.info(f">>> {__name__}:{update.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_COMPANY)
-    return await utils.update(collection, id, data)
+    if ObjectId.is_valid(ref):
+        return await utils.update(collection, ref, data)
+    return await utils.update(collection, ref.upper(), data, "symbol")
 
 """
 Append tag to tags
@@ -51,17 +58,11 @@ async def add_contacts(db: DBClient, ref: str, data: List[Contact]):
     """sss"""
     logging.info(f">>> {__name__}:{add_contacts.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_COMPANY)
-    modified_count = 0
-    # Manually one by one
-    # TODO:
-    for x in data:
-        rs = await collection.update_one(
-            {"_id": ObjectId(ref)},
-            {"$push": {"contacts": x.dict()}}
-        )
-        modified_count += rs.modified_count
-    logging.info("Modified: " + str(modified_count))
-    if rs.modified_count > 0:
+    rs = await utils.push_many(
+        collection, ref, "contacts", [x.dict() for x in data]
+    )
+    logging.info("Modified: " + str(len(rs.succeeded)))
+    if rs.succeeded:
         return data
 
 
@@ -1,183 +1,524 @@
+import hashlib
 import logging
-from random import shuffle
 from time import time
 from typing import List
 
 from bson.objectid import ObjectId
+from cachetools import TTLCache
 from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 # from app.m
-from app.core.config import DOCTYPE_EV_GPQ, DOCTYPE_PERSONA, GPQ_TOTAL_ITEMS
+from app.core.config import (DOCTYPE_EV_GPQ, DOCTYPE_PERSONA,
+                             EXPORT_BATCH_SIZE, GPQ_FLUSH_MS, GPQ_FLUSH_ROWS,
+                             GPQ_ITEMS_VERSION, GPQ_SESSION_MAXSIZE,
+                             GPQ_SESSION_TTL, GPQ_TOTAL_ITEMS,
+                             GPQ_WRITE_MODE)
+from app.core.events import progress_bus
 from app.crud import utils as crudutils
+from app.db.itembank import get_bank
 from app.db.mongo import AsyncIOMotorClient as DBClient
-from app.models.dbmodel import BaseModel
-from app.models.pev.gpq import GPQEvidenceInDB, GPQRow
+from app.db.sessions import gpq_sessions
+from app.models.base import BaseModel
+from app.models.evidence.gpq import (GPQAnswers, GPQEvidenceInDB, GPQRow,
+                                     encode_records, record_rows)
+from app.scoring.norms import element_tally, gpq_norms
+from app.scoring.timing import gpq_timing
 
 
-gpq_touch_stacks = {}
+# Answers only go to running evidences that still have the row layout
+RUNNING = { "stopped": None, "records": { "$type": "array" } }
 
+gpq_writes = crudutils.WriteBehind(
+    DOCTYPE_EV_GPQ, GPQ_FLUSH_ROWS, GPQ_FLUSH_MS, filter=RUNNING
+)
 
-async def get_multi(db: DBClient, limit: int, skip: int):
+# (prj_id, username) -> evidence id, ids never change once resolved
+evidence_ids = TTLCache(maxsize=GPQ_SESSION_MAXSIZE, ttl=GPQ_SESSION_TTL)
+
+
+async def get_multi(db: DBClient, limit: int, skip: int, cursor: str = None,
+projection: dict = None):
     logging.info(f">>> {__name__}:{get_multi.__name__}")
     collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
-    return await crudutils.get_multi(collection, limit, skip)
+    return await crudutils.get_multi(collection, limit, skip, cursor,
+        projection=projection)
+
+
+async def get(db: DBClient, id: str, projection: dict = None):
+    logging.info(f">>> {__name__}:{get.__name__}")
+    collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
+    return await collection.find_one({"_id": ObjectId(id)}, projection)
 
 
-async def get_by_project(db: DBClient, id: str, limit: int, skip: int):
+async def get_by_project(db: DBClient, id: str, limit: int, skip: int,
+cursor: str = None, projection: dict = None):
+    """Ordered by username, backed by the (prj_id, username) index"""
     logging.info(f">>> {__name__}:{get_by_project.__name__}")
     collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
-    rs: List[BaseModel] = []
-    cursor = collection.find(
-        {"prj_id": ObjectId(id)},
-        limit=limit,
-        skip=skip
+    return await crudutils.get_multi_by_filter(
+        collection, {"prj_id": ObjectId(id)}, limit, skip, cursor, "username",
+        projection
     )
-    async for row in cursor:
-        rs.append(row)
-    return rs
+
+
+async def get_touched(db: DBClient, prj_id: str, usernames: List[str]):
+    """
+    `username`, `started`, `touched` and the last answered `seq` of the
+    given personas' evidences
+    """
+    logging.info(f">>> {__name__}:{get_touched.__name__}")
+    collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
+    answered = {
+        "$filter": {
+            "input": "$records",
+            "as": "r",
+            "cond": "$$r.element"
+        }
+    }
+    rows = collection.aggregate([
+        { "$match": {
+            "prj_id": ObjectId(prj_id), "username": {"$in": usernames}
+        } },
+        { "$project": {
+            "_id": 0,
+            "username": 1,
+            "started": 1,
+            "touched": 1,
+            "seq": { "$cond": [
+                { "$isArray": "$records" },
+                { "$max": { "$map": {
+                    "input": answered, "as": "r", "in": "$$r.seq"
+                } } },
+                None
+            ] }
+        } }
+    ])
+    return [row async for row in rows]
+
+
+async def iter_by_project(db: DBClient, id: str, projection: dict = None,
+batch_size: int = EXPORT_BATCH_SIZE):
+    """Yield a project's evidences one by one, for exports"""
+    logging.info(f">>> {__name__}:{iter_by_project.__name__}")
+    collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
+    rows = collection.find(
+        {"prj_id": ObjectId(id)}, projection,
+        sort=[("username", 1)], batch_size=batch_size
+    )
+    async for row in rows:
+        yield row
+
+
+def evidence_id(prj_id: str, username: str):
+    """
+    Evidence ids are derived from (prj_id, username), so they are known
+    before the document exists. Their timestamp part is meaningless.
+    """
+    key = f"{DOCTYPE_EV_GPQ}:{prj_id}:{username}"
+    return ObjectId(hashlib.sha1(key.encode()).digest()[:12])
+
+
+def item_order(prj_id: str, username: str, version: str = GPQ_ITEMS_VERSION,
+rows: int = GPQ_TOTAL_ITEMS):
+    """Seeded permutation of wb_seq 1..rows, the same on every call"""
+    seed = f"{prj_id}:{username}:{version}"
+    return sorted(
+        range(1, rows + 1),
+        key=lambda x: hashlib.sha1(f"{seed}:{x}".encode()).digest()
+    )
+
+
+def template_records(prj_id: str, username: str, version: str, rows: int):
+    return [
+        GPQRow(seq=i + 1, wb_seq=wb_seq).dict()
+        for i, wb_seq in enumerate(item_order(prj_id, username, version, rows))
+    ]
+
+
+def evidence_template(prj_id: str, username: str, fullname: str,
+rows: int = GPQ_TOTAL_ITEMS):
+    """Fields of a new evidence, every path that creates one uses this"""
+    return {
+        'prj_id': ObjectId(prj_id),
+        'version': GPQ_ITEMS_VERSION,
+        'username': username,
+        'fullname': fullname,
+        'records': template_records(
+            prj_id, username, GPQ_ITEMS_VERSION, rows or GPQ_TOTAL_ITEMS
+        )
+    }
 
 
 async def create_template(
     db: DBClient, prj_id: str, username: str, fullname: str, rows: int
     ):
+    """
+    The evidence as it will look once materialized. Nothing is written,
+    the document is created by `materialize` when the persona begins.
+    """
     logging.info(f">>> {__name__}:{create_template.__name__}")
-    records: List[GPQRow] = []
-    seqs = [i for i in range(1, rows + 1)]
-    shuffle(seqs)
+    return {
+        '_id': evidence_id(prj_id, username),
+        **evidence_template(prj_id, username, fullname, rows)
+    }
 
-    for i in range(rows):
-        records.append(GPQRow(
-            seq = i + 1,
-            wb_seq = seqs[i]
-        ))
 
+async def materialize(db: DBClient, prj_id: str, username: str,
+rows: int = GPQ_TOTAL_ITEMS):
+    """
+    Create the persona's evidence unless it exists (one upsert), returns
+    its id or None when there is no such persona in the project.
+    """
+    logging.info(f">>> {__name__}:{materialize.__name__}")
+    personas = crudutils.get_collection(db, DOCTYPE_PERSONA)
+    persona = await personas.find_one(
+        {"prj_id": ObjectId(prj_id), "username": username},
+        {"_id": 0, "fullname": 1}
+    )
+    if not persona:
+        return None
+    id = evidence_id(prj_id, username)
     collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
-    template = {
-        'prj_id': ObjectId(prj_id),
-        'username': username,
-        'fullname': fullname,
-        'records': records
-    }
-    data = GPQEvidenceInDB(**template)
-    return await crudutils.create(collection, data)
+    try:
+        await collection.update_one(
+            {"_id": id},
+            {"$setOnInsert": evidence_template(
+                prj_id, username, persona.get("fullname"), rows
+            )},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # A concurrent upsert won, or an older evidence has another _id
+        ev = await collection.find_one(
+            {"prj_id": ObjectId(prj_id), "username": username}, {"_id": 1}
+        )
+        return str(ev["_id"]) if ev else None
+    return str(id)
+
+
+async def ensure_evidence(db: DBClient, prj_id: str, username: str):
+    """
+    Id of the persona's evidence, materialized on first use. Looked up
+    on the unique (prj_id, username) index once, then cached.
+    """
+    key = (prj_id, username)
+    id = evidence_ids.get(key)
+    if id:
+        return id
+    collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
+    ev = await collection.find_one(
+        {"prj_id": ObjectId(prj_id), "username": username}, {"_id": 1}
+    )
+    id = str(ev["_id"]) if ev else await materialize(db, prj_id, username)
+    if id:
+        evidence_ids[key] = id
+    return id
 
 
-# > if it is in stacks:
+# > if it is in the session store:
 #     > just return
 # > if not: check db
 #     > if not in db (hot init)
-#         > just create one in stacks
+#         > just create one in store
 #         > save to db
 #     > if it is in db, it may be app has restarted or user has logout before
 #         > retrieve from db
-#         > copy to stacks
+#         > copy to store
 #         > update `touched`
 
 async def init(db: DBClient, id: str):
     logging.info(f">>> {__name__}:{init.__name__}")
 
-    # If it is in stacks, just return it
-    if (id in gpq_touch_stacks and
-        "initiated" in gpq_touch_stacks[id] and
-        gpq_touch_stacks[id]["initiated"]):
-        return { "initiated": gpq_touch_stacks[id]["initiated"] }
-    # It is not in stacks, check db
+    # If it is in the store, just return it
+    state = await gpq_sessions.get(id)
+    if state and state.get("initiated"):
+        return { "initiated": state["initiated"] }
+
+    # It is not in the store, check db
+    collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
+    ev = await collection.find_one(
+        {"_id": ObjectId(id)},
+        {"_id": 0, "initiated": 1, "started": 1, "stopped": 1, "prj_id": 1,
+         "username": 1, "version": 1, "submitted": 1}
+    )
+    logging.info( str(ev) )
+    if not ev:
+        return None
+
+    ts = round(time() * 1000)
+    state = {
+        "prj_id": str(ev["prj_id"]),
+        "username": ev["username"],
+        "version": ev.get("version") or GPQ_ITEMS_VERSION,
+        "stopped": ev.get("stopped"),
+        "submitted": ev.get("submitted"),
+        "touched": ts
+    }
+    if not ev.get("initiated"):
+        state["initiated"] = ts
+        update = { "initiated": ts, "touched": ts }
     else:
-        gpq_touch_stacks[id] = {
-            "initiated": None, "started": None, "touched": None
-        }
-        # Check state from db
-        collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
-        ev = await collection.find_one(
-            {"_id": ObjectId(id)},
-            {"_id": 0, "initiated": 1, "started": 1}
-        )
-        logging.info( str(ev) )
-
-        ts = round(time() * 1000)
-        if not ev["initiated"] or ev["initiated"] is None:
-            gpq_touch_stacks[id]["initiated"] = ts
-            gpq_touch_stacks[id]["started"] = None
-            gpq_touch_stacks[id]["touched"] = ts
-            rs = await collection.find_one_and_update(
-                { "_id": ObjectId(id) },
-                { "$set": { "initiated": ts, "touched": ts } },
-                {"_id": 0, "initiated": 1},
-                return_document=ReturnDocument.AFTER
-            )
-            return rs
-        else:
-            gpq_touch_stacks[id]["initiated"] = ev["initiated"]
-            if ev["started"]:
-                gpq_touch_stacks[id]["started"] = ev["started"]
-            gpq_touch_stacks[id]["touched"] = ts
-            rs = await collection.find_one_and_update(
-                { "_id": ObjectId(id) },
-                { "$set": { "touched": ts } },
-                {"_id": 0, "initiated": 1}
-            )
-            return rs
+        state["initiated"] = ev["initiated"]
+        state["started"] = ev.get("started")
+        update = { "touched": ts }
+    await gpq_sessions.set(id, state)
+    await collection.update_one({ "_id": ObjectId(id) }, { "$set": update })
+    notify(state, { "touched": ts })
+    return { "initiated": state["initiated"] }
 
 
 async def start(db: DBClient, id: str):
     logging.info(f">>> {__name__}:{start.__name__}")
     collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
     ts = round(time() * 1000)
-    gpq_touch_stacks[id] = ts
-    print(gpq_touch_stacks)
     rs = await collection.find_one_and_update(
         { "_id": ObjectId(id) },
         { "$set": { "started": ts, "touched": ts } },
         { "_id": 0, u"started": 1 },
         return_document=ReturnDocument.AFTER
     )
+    if rs:
+        await gpq_sessions.set(id, { "started": ts, "touched": ts })
+        notify(await gpq_sessions.get(id), { "started": ts, "touched": ts })
     return rs
 
 
+def notify(state: dict, fields: dict):
+    """Publish a GPQ change to the project's live progress feed"""
+    if state and "prj_id" in state:
+        progress_bus.publish(state["prj_id"], {
+            "username": state["username"], "gpq": fields
+        })
+
+
+async def touch_session(collection, id: str, ts: int):
+    """
+    Set `touched` and return the previous session state, which carries
+    `touched`, `prj_id`, `username` and `version`. The evidence is read only when
+    the store has lost the session.
+    """
+    state = await gpq_sessions.touch(id, ts)
+    if state and "prj_id" in state:
+        return state
+    # Evicted, or app has been restarted and id isn't in the store
+    ev = await collection.find_one(
+        { "_id": ObjectId(id) },
+        { "_id": 1, "touched": 1, "prj_id": 1, "username": 1, "version": 1,
+          "stopped": 1, "submitted": 1 }
+    )
+    if not ev:
+        return None
+    state = {
+        **(state or {}),
+        "prj_id": str(ev["prj_id"]),
+        "username": ev["username"],
+        "version": ev.get("version") or GPQ_ITEMS_VERSION,
+        "stopped": ev.get("stopped"),
+        "submitted": ev.get("submitted")
+    }
+    await gpq_sessions.set(id, state)
+    state["touched"] = ev.get("touched") or ts
+    return state
+
+
+def session_bank(state: dict):
+    return get_bank("GPQ", state.get("version") or GPQ_ITEMS_VERSION)
+
+
+def bank_answer(bank, dic: dict):
+    """
+    Answers by `option` store the element code only, the statement is
+    read from the bank. Raises ValueError for an option not in the bank.
+    """
+    if dic.get("option") is None:
+        return dic
+    if bank is None:
+        raise ValueError("No item bank for this evidence")
+    try:
+        dic["element"] = bank.element(dic["wb_seq"], dic["option"])
+    except KeyError:
+        raise ValueError(f"No option {dic['option']} for item {dic['wb_seq']}")
+    dic.pop("statement", None)
+    return dic
+
+
 async def update(
     db: DBClient,
     id: str,
     seq: int,
     wb_seq: int,
-    element: str,
-    statement: str,
-    # last_touch: int
+    element: str = None,
+    statement: str = None,
+    option: int = None
     ):
-    logging.info(f">>> {__name__}:{update_row.__name__}")
+    """Save one answer, by `option` or by `element` and `statement`"""
+    logging.info(f">>> {__name__}:{update.__name__}")
+    if not 1 <= seq <= GPQ_TOTAL_ITEMS:
+        raise ValueError(f"seq must be 1..{GPQ_TOTAL_ITEMS}")
     collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
 
-    if not id in gpq_touch_stacks:
-        # If app has been restarted and id isn't in stack
-        ev = await collection.find_one({ "_id": ObjectId(id) }, { "_id": 1, "touched": 1 })
-        gpq_touch_stacks[id] = ev["touched"]
-
-    last_touch = gpq_touch_stacks[id]
     ts = round(time() * 1000)
-    elapsed = ts - last_touch
-    gpq_touch_stacks[id] = ts
+    state = await touch_session(collection, id, ts)
+    if not state:
+        return None
+    if state.get("stopped"):
+        raise ValueError("GPQ evidence is already finished")
+    elapsed = ts - (state.get("touched") or ts)
 
     dic = {}
     dic['seq'] = seq
     dic['wb_seq'] = wb_seq
+    dic['option'] = option
     dic['element'] = element
     dic['statement'] = statement
+    bank_answer(session_bank(state), dic)
 
     dic["saved"] = ts
     dic["elapsed"] = elapsed
     index = seq - 1
     docpath = "records." + str(index)
 
+    async def written():
+        await gpq_timing.record(
+            state["prj_id"], state["username"], wb_seq, elapsed, ts
+        )
+        notify(state, { "touched": ts, "seq": seq })
+
+    if GPQ_WRITE_MODE != "direct":
+        # Timing and progress follow the write, not the queueing
+        saved = await gpq_writes.add_update(
+            id, { "$set": { docpath: dic }, "$max": { "touched": ts } },
+            wait=GPQ_WRITE_MODE == "flushed", on_written=written
+        )
+        return { "touched": ts } if saved else None
     rs = await collection.find_one_and_update(
-        { "_id": ObjectId(id) },
-        { "$set": { "touched": ts, docpath: dic } },
+        { "_id": ObjectId(id), **RUNNING },
+        { "$set": { docpath: dic }, "$max": { "touched": ts } },
         { "_id": 0, u"touched": 1 },
         return_document=ReturnDocument.AFTER
     )
     if rs:
+        await written()
         return rs  # ['records'][index]
     return None
 
 
+def answer_paths(answers: GPQAnswers, bank=None):
+    """
+    `records.N` paths for the queued answers. `elapsed` is derived from
+    the client timestamps only, so replaying the same batch sets the same
+    values.
+    """
+    paths = {}
+    previous = answers.since
+    for row in answers.rows:
+        dic = bank_answer(bank, row.dict())
+        dic["elapsed"] = row.saved - previous
+        previous = row.saved
+        paths["records." + str(row.seq - 1)] = dic
+    return paths
+
+
+async def submit(db: DBClient, id: str, answers: GPQAnswers):
+    """Save several answers with one update"""
+    logging.info(f">>> {__name__}:{submit.__name__}")
+    collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
+    ts = round(time() * 1000)
+    state = await touch_session(collection, id, ts)
+    if not state:
+        return None
+    if state.get("stopped"):
+        raise ValueError("GPQ evidence is already finished")
+    paths = answer_paths(answers, session_bank(state))
+    latest = max([row["saved"] for row in paths.values()] + [0])
+    # `submitted`, the newest client `saved` written, is kept with the
+    # evidence so replayed rows are not timed twice after a restart
+    update = {
+        "$set": paths, "$max": { "touched": ts, "submitted": latest }
+    }
+
+    async def written(submitted: int):
+        # Replayed rows were counted already, `submitted` is in client time
+        for path, row in paths.items():
+            if row["saved"] > submitted:
+                await gpq_timing.record(
+                    state["prj_id"], state["username"], row["wb_seq"],
+                    row["elapsed"], row["saved"]
+                )
+        await gpq_sessions.set(id, { "submitted": max(latest, submitted) })
+        notify(state, {
+            "touched": ts,
+            "seq": max((row["seq"] for row in paths.values()), default=None)
+        })
+
+    async def buffered_written():
+        current = await gpq_sessions.get(id) or {}
+        await written(
+            current.get("submitted") or state.get("submitted") or 0
+        )
+
+    if GPQ_WRITE_MODE != "direct":
+        saved = await gpq_writes.add_update(
+            id, update, wait=GPQ_WRITE_MODE == "flushed",
+            on_written=buffered_written
+        )
+        if not saved:
+            return None
+    else:
+        # The marker before this write decides which rows are new
+        before = await collection.find_one_and_update(
+            { "_id": ObjectId(id), **RUNNING }, update,
+            { "_id": 0, "submitted": 1 },
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return None
+        await written(before.get("submitted") or 0)
+    return { "touched": ts, "count": len(paths) }
+
+
+async def resume(db: DBClient, id: str):
+    """
+    Session state and the rows still to answer, as `seq`/`wb_seq` pairs.
+    Rows are filtered by the server, compact (finished) records have none.
+    """
+    logging.info(f">>> {__name__}:{resume.__name__}")
+    if GPQ_WRITE_MODE != "direct":
+        # Queued answers must be visible to the filter
+        await gpq_writes.flush()
+    collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
+    pending = {
+        "$filter": {
+            "input": "$records",
+            "as": "r",
+            "cond": { "$not": ["$$r.element"] }
+        }
+    }
+    rows = collection.aggregate([
+        { "$match": { "_id": ObjectId(id) } },
+        { "$project": {
+            "_id": 0,
+            "initiated": 1,
+            "started": 1,
+            "touched": 1,
+            "stopped": 1,
+            "remaining": { "$cond": [
+                { "$isArray": "$records" },
+                { "$map": {
+                    "input": pending,
+                    "as": "r",
+                    "in": { "seq": "$$r.seq", "wb_seq": "$$r.wb_seq" }
+                } },
+                []
+            ] }
+        } }
+    ])
+    async for row in rows:
+        return row
+    return None
+
+
 
 
 
@@ -185,6 +526,54 @@ async def update(
 
 
 
+async def finish(db: DBClient, id: str):
+    """
+    Stop the evidence, once, and add its element tally to the norms.
+    Returns None when there is no such running evidence.
+    """
+    logging.info(f">>> {__name__}:{finish.__name__}")
+    if GPQ_WRITE_MODE != "direct":
+        await gpq_writes.flush()
+    collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
+    ts = round(time() * 1000)
+    ev = await collection.find_one_and_update(
+        { "_id": ObjectId(id), "stopped": None },
+        { "$set": { "stopped": ts, "touched": ts } },
+        { "prj_id": 1, "username": 1, "records.element": 1 },
+        return_document=ReturnDocument.AFTER
+    )
+    if not ev:
+        return None
+    await gpq_sessions.set(id, { "stopped": ts })
+    tally = element_tally(record_rows(ev.get("records")))
+    await gpq_norms.record(db, str(ev["prj_id"]), tally)
+    notify(
+        { "prj_id": str(ev["prj_id"]), "username": ev["username"] },
+        { "stopped": ts, "touched": ts }
+    )
+    return { "stopped": ts, "elements": tally }
+
+
+async def compact(db: DBClient, id: str):
+    """
+    Rewrite the records of a finished evidence in the compact layout.
+    Running evidences keep the row layout, answers are saved by path.
+    """
+    logging.info(f">>> {__name__}:{compact.__name__}")
+    collection = crudutils.get_collection(db, DOCTYPE_EV_GPQ)
+    ev = await collection.find_one(
+        {"_id": ObjectId(id), "stopped": {"$ne": None}},
+        {"records": 1}
+    )
+    if not ev or not isinstance(ev.get("records"), list):
+        return None
+    rs = await collection.update_one(
+        {"_id": ObjectId(id), "records": {"$type": "array"}},
+        {"$set": {"records": encode_records(ev["records"])}}
+    )
+    return rs.modified_count > 0
+
+
 async def create_db_template(
     db: DBClient,
     prj_id: str,
@@ -202,8 +591,7 @@ async def create_db_template(
 
     prj_id = ObjectId(prj_id)
     records: List[GPQRow] = []
-    seqs = [i for i in range(1, rows + 1)]
-    shuffle(seqs)
+    seqs = item_order(str(prj_id), username, GPQ_ITEMS_VERSION, rows)
 
     for i in range(rows):
         records.append(GPQRow(
@@ -242,8 +630,7 @@ async def create_db_template2(
     _id = "GPQ" + persona_id
     prj_id = ObjectId(prj_id)
     records: List[GPQRow] = []
-    seqs = [i for i in range(1, rows + 1)]
-    shuffle(seqs)
+    seqs = item_order(str(prj_id), persona['username'], GPQ_ITEMS_VERSION, rows)
 
     for i in range(rows):
         records.append(GPQRow(
@@ -6,11 +6,16 @@ from fastapi.encoders import jsonable_encoder
 from pymongo import ReturnDocument
 
 from app.core.config import DOCTYPE_PERSONA
-from app.core.security import get_password_hash, verify_password
+from app.core.events import progress_bus
+from app.core.jwt import forget_token_version
+from app.core.security import hasher
 from app.crud import utils
 from app.db.mongo import AsyncIOMotorClient as DBClient
 from app.models.persona import Battery, Persona, PersonaCreate, PersonaUpdate, Progress, ProjectPersona
 
+# Changing any of these invalidates the persona's access tokens
+REVOKING_FIELDS = ("hashed_password", "disabled")
+
 # Persona always belongs to project
 # Two personas in different projects can have identical username
 #
@@ -22,7 +27,7 @@ async def authenticate(db: DBClient, username: str, password: str, prj_id: str):
     )
     if not user:
         return None
-    if not verify_password(password, user['hashed_password']):
+    if not await hasher.verify(password, user['hashed_password']):
         return None
     return user
 
@@ -35,7 +40,7 @@ async def authenticate_persona(db: DBClient, username: str, password: str, prj_i
     )
     if not user:
         return None
-    if not verify_password(password, user['hashed_password']):
+    if not await hasher.verify(password, user['hashed_password']):
         return None
     return user
 
@@ -48,9 +53,24 @@ async def update_progress(db: DBClient, prj_id: str, username: str, progress: Pr
         {"_id": 0, "progress": 1},
         return_document=ReturnDocument.AFTER
     )
+    if rs:
+        progress_bus.publish(prj_id, {
+            "username": username, "progress": rs["progress"]
+        })
     return rs
 
 
+async def get_progress(db: DBClient, prj_id: str, usernames: List[str]):
+    """`username` and `progress` of the given personas"""
+    logging.info(f">>> {__name__}:{get_progress.__name__}")
+    collection = utils.get_collection(db, DOCTYPE_PERSONA)
+    rows = collection.find(
+        {"prj_id": ObjectId(prj_id), "username": {"$in": usernames}},
+        {"_id": 0, "username": 1, "progress": 1}
+    )
+    return [row async for row in rows]
+
+
 
 async def get(db: DBClient, ref: str):
     logging.info(f">>> {__name__}: {get.__name__}")
@@ -66,10 +86,13 @@ async def get_multi(db: DBClient, limit: int, skip: int):
     return await utils.get_multi(collection, limit, skip)
 
 
-async def get_multi_filtered(db: DBClient, filter: dict, limit: int, skip: int):
+async def get_multi_filtered(db: DBClient, filter: dict, limit: int, skip: int,
+cursor: str = None, projection: dict = None):
+    """Ordered by username, backed by the (prj_id, username) index"""
     logging.info(f">>> {__name__}:{get_multi_filtered.__name__}")
     collection = utils.get_collection(db, DOCTYPE_PERSONA)
-    return await utils.get_multi_by_filter(collection, filter, limit, skip)
+    return await utils.get_multi_by_filter(collection, filter, limit, skip,
+        cursor, "username", projection)
 
 # {
 #     "fullname": "Lansia Sutopo",
@@ -98,10 +121,29 @@ async def create_multi(db: DBClient, data: List[Any]):
     return rs.inserted_ids
 
 
-async def update(db: DBClient, id: str, data: PersonaUpdate):
+async def update(db: DBClient, ref: str, data: PersonaUpdate):
+    """`ref` is the persona id or username, returns a `WriteResult`"""
     logging.info(f">>> {__name__}:{update.__name__}")
     collection = utils.get_collection(db, DOCTYPE_PERSONA)
-    return await utils.update(collection, id, data)
+    if ObjectId.is_valid(ref):
+        rs = await utils.update(collection, ref, data)
+    else:
+        rs = await utils.update(collection, ref, data, "username")
+    if set(rs.changed) & set(REVOKING_FIELDS):
+        persona = rs.doc
+        await revoke_tokens(db, str(persona['prj_id']), persona['username'])
+    return rs
+
+
+async def revoke_tokens(db: DBClient, prj_id: str, username: str):
+    """Invalidate every access token issued to the persona"""
+    logging.info(f">>> {__name__}:{revoke_tokens.__name__}")
+    collection = utils.get_collection(db, DOCTYPE_PERSONA)
+    await collection.update_one(
+        {"prj_id": ObjectId(prj_id), "username": username},
+        {"$inc": {"token_version": 1}}
+    )
+    forget_token_version(username, prj_id)
 
 
 async def set_batteries(db: DBClient, id: str, batteries: List[Battery]):
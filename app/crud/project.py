@@ -7,13 +7,15 @@ from pymongo import ReturnDocument
 
 from app.api.utils import create_422_response, create_aliased_response
 from app.core import config
-from app.core.security import get_password_hash, verify_password
+from app.core.jwt import forget_token_version
+from app.core.security import hasher
 from app.crud import utils
+from app.crud.gpq import evidence_id
 from app.db.mongo import AsyncIOMotorClient as DBClient
 from app.models.base import Workbook
 from app.models.batch import (Batch, BatchBase, BatchCreate, FacetimeSession,
                               WorkbookSession)
-from app.models.project import (Guest, GuestCreate, ProjectBase,
+from app.models.project import (Guest, GuestCreate, GuestUpdate, ProjectBase,
                                 ProjectCreate, ProjectInDB)
 from app.models.persona import Battery
 from app.models.user import UserInApp, UserInDB
@@ -41,13 +43,24 @@ async def get_project_member(db: DBClient, prj_id: str, username: str):
             "members": {"$elemMatch": {"username": username}}
         }
     )
-    if len(rs['members']) > 0:
+    if rs and len(rs['members']) > 0:
         user = rs['members'][0]
         # user['type'] = user['role']
         return user
     return None
 
 
+async def revoke_member_tokens(db: DBClient, prj_id: str, username: str):
+    """Invalidate every access token issued to a project client/expert"""
+    logging.info(f">>> {__name__}:{revoke_member_tokens.__name__}")
+    collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
+    await collection.update_one(
+        {"_id": ObjectId(prj_id), "members.username": username},
+        {"$inc": {"members.$.token_version": 1}}
+    )
+    forget_token_version(username, prj_id)
+
+
 async def authenticate_member(db: DBClient, username: str, password: str,
 role: str, context: str):
     logging.info(f">>> {__name__}:{authenticate_member.__name__}")
@@ -62,7 +75,7 @@ role: str, context: str):
     if len(rs['members']) > 0:
         user = rs['members'][0]
         # print(user)
-        if verify_password(password, user['hashed_password']):
+        if await hasher.verify(password, user['hashed_password']):
             return user
 
 
@@ -85,23 +98,71 @@ async def is_project_member(db: DBClient, user: UserInApp, id: str):
     return user['context'] == id;
 
 
-async def get(db: DBClient, id: str):
+async def get(db: DBClient, id: str, projection: dict = None):
     logging.info(f">>> {__name__}:{get.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
-    return await utils.get(collection, id)
+    return await utils.get(collection, id, projection=projection)
+
+
+async def load(db: DBClient, id: str, projection: dict = None):
+    """Single read used by the request-scoped project loader"""
+    logging.info(f">>> {__name__}:{load.__name__}")
+    collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
+    return await collection.find_one({"_id": ObjectId(id)}, projection)
+
+
+def is_manager_of(project: dict, user: UserInApp):
+    """Same rule as `is_project_manager`, answered from a loaded project"""
+    return project.get('lead_by') == user['username']
+
+
+def is_member_of(project: dict, user: UserInApp):
+    """Same rule as `is_project_member`, answered from a loaded project"""
+    if is_manager_of(project, user):
+        return True
+    return user['context'] == str(project['_id'])
+
+
+def filter_members(project: dict, type: str):
+    guests = []
+    for guest in project.get('members', []):
+        if guest['type'] == type:
+            guests.append(Guest(**guest))
+    return guests
 
 
-async def get_multi(db: DBClient, limit: int, skip: int):
+def select_modules(project: dict, type: str=""):
+    workbooks = project.get('workbooks', [])
+    facetimes = project.get('facetimes', [])
+    if type == "workbook":
+        return workbooks
+    elif type == "facetime":
+        return facetimes
+    return workbooks + facetimes
+
+
+def find_batch(project: dict, batch_id: str):
+    for batch in project.get('batches', []):
+        if batch.get('batch_id') == batch_id:
+            return batch
+    return None
+
+
+async def get_multi(db: DBClient, limit: int, skip: int, cursor: str = None,
+projection: dict = None):
     logging.info(f">>> {__name__}:{get_multi.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
-    return await utils.get_multi(collection, limit, skip)
+    return await utils.get_multi(collection, limit, skip, cursor,
+        projection=projection)
 
 
-async def get_multi_by_filter(db: DBClient, filter: dict, limit: int = 50, skip: int = 0):
+async def get_multi_by_filter(db: DBClient, filter: dict, limit: int = 50, skip: int = 0,
+cursor: str = None, projection: dict = None):
     logging.info(">>> " + __name__ + ":" + get_multi_by_filter.__name__ )
     collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
     # filter = {}
-    return await utils.get_multi_by_filter(collection, filter, limit, skip)
+    return await utils.get_multi_by_filter(collection, filter, limit, skip,
+        cursor, projection=projection)
 
 
 async def get_project_manager(db: DBClient, id: str):
@@ -123,26 +184,14 @@ async def create(db: DBClient, data: ProjectCreate):
 
 
 async def update(db: DBClient, id: str, data: ProjectBase):
+    """Returns a `WriteResult`"""
     logging.info(f">>> {__name__}:{update.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
     return await utils.update(collection, id, data)
 
 
-async def check_free_member_slot(db: DBClient, id: str, email: str,
-username: str):
-    logging.info(f">>> {__name__}:{check_free_member_slot.__name__}")
-    collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
-    rs = await collection.find_one(
-        {
-            "_id": ObjectId(id),
-            "$or": [{"members.username": username}, {"members.email": email}]
-        },
-        {"_id": 0, "members": 1}
-    )
-    return rs is None
-
-
 async def add_member(db: DBClient, ref: str, mtype: str, data: GuestCreate):
+    """Returns None when the username or email is already in the project"""
     logging.info(f">>> {__name__}:{add_member.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
 
@@ -150,16 +199,75 @@ async def add_member(db: DBClient, ref: str, mtype: str, data: GuestCreate):
         "_id": str(ObjectId()),
         **data.dict(),
         "type": mtype,
-        "hashed_password": get_password_hash(data.password)
+        "hashed_password": await hasher.hash(data.password)
     }
     del dic["password"]
     rs = await collection.find_one_and_update(
-        {"_id": ObjectId(ref)},
+        {
+            "_id": ObjectId(ref),
+            "members.username": {"$ne": data.username},
+            "members.email": {"$ne": data.email}
+        },
         {"$push": {"members": dic}},
         {"_id": 0, "members": {"$elemMatch": {"username": data.username}}},
         return_document=ReturnDocument.AFTER
     )
-    if rs['members']:
+    if rs and rs['members']:
+        return rs['members'][0]
+    return None
+
+
+# Changing any of these invalidates the member's access tokens
+MEMBER_REVOKING_FIELDS = ("hashed_password", "disabled")
+
+
+async def update_member(db: DBClient, id: str, mtype: str, username: str,
+data: GuestUpdate):
+    """
+    Set the given fields of a client/expert, returns the member after the
+    update or None when there is no such member.
+    """
+    logging.info(f">>> {__name__}:{update_member.__name__}")
+    collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
+    fields = {k: v for k, v in data.dict().items() if v is not None}
+    password = fields.pop("password", None)
+    if password:
+        fields["hashed_password"] = await hasher.hash(password)
+    member = {"username": username, "type": mtype}
+    filter = {"_id": ObjectId(id), "members": {"$elemMatch": member}}
+    projection = {"_id": 0, "members": {"$elemMatch": member}}
+    if fields:
+        rs = await collection.find_one_and_update(
+            filter,
+            {"$set": {"members.$." + k: v for k, v in fields.items()}},
+            projection,
+            return_document=ReturnDocument.BEFORE
+        )
+    else:
+        rs = await collection.find_one(filter, projection)
+    if not rs or not rs.get('members'):
+        return None
+    before = rs['members'][0]
+    if any(before.get(k) != fields[k] for k in MEMBER_REVOKING_FIELDS
+        if k in fields):
+        await revoke_member_tokens(db, id, username)
+    return {**before, **fields}
+
+
+async def remove_member(db: DBClient, id: str, mtype: str, username: str):
+    """Remove a client/expert and revoke its tokens, returns the member"""
+    logging.info(f">>> {__name__}:{remove_member.__name__}")
+    collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
+    member = {"username": username, "type": mtype}
+    # Revoke first: the version lives on the member entry being removed
+    await revoke_member_tokens(db, id, username)
+    rs = await collection.find_one_and_update(
+        {"_id": ObjectId(id), "members": {"$elemMatch": member}},
+        {"$pull": {"members": member}},
+        {"_id": 0, "members": {"$elemMatch": member}},
+        return_document=ReturnDocument.BEFORE
+    )
+    if rs and rs.get('members'):
         return rs['members'][0]
     return None
 
@@ -171,12 +279,7 @@ async def get_members(db: DBClient, id: str, type: str):
         {"_id": ObjectId(id)},
         {"_id": 0, "members": 1}
     )
-    members = rs['members']
-    guests = []
-    for guest in members:
-        if guest['type'] == type:
-            guests.append(Guest(**guest))
-    return guests
+    return filter_members(rs, type)
 
 
 async def get_batches(db: DBClient, id: str):
@@ -213,24 +316,33 @@ async def create_batch(db: DBClient, id: str, data: BatchCreate):
 
 async def add_workbook_session(db: DBClient, id: str, batch_id: str,
 data: WorkbookSession):
+    """Returns None when the batch already has a session for the module"""
     logging.info(f">>> {__name__}:{add_workbook_session.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
     dic = data.dict()
 
     """batches.$.workbook_sessions => matched index"""
     rs = await collection.find_one_and_update(
-        {"_id": ObjectId(id), "batches.batch_id": batch_id},
+        {
+            "_id": ObjectId(id),
+            "batches": {"$elemMatch": {
+                "batch_id": batch_id,
+                "workbook_sessions.module": {"$ne": data.module}
+            }}
+        },
         {"$push": {"batches.$.workbook_sessions": dic}},
         {"_id": 0, "batches": {"$elemMatch": {"batch_id": batch_id}}},
         return_document=ReturnDocument.AFTER
     )
-    print(rs)
+    if not rs:
+        return None
     count = len(rs['batches'][0]['workbook_sessions'])
     return rs['batches'][0]['workbook_sessions'][count -1]
 
 
 async def add_facetime_session(db: DBClient, id: str, batch_id: str,
 data: FacetimeSession):
+    """Returns None when the batch already has a session for the module"""
     logging.info(f">>> {__name__}:{add_facetime_session.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
     # dic = data.dict()
@@ -238,12 +350,19 @@ data: FacetimeSession):
     $ matched index
     """
     rs = await collection.find_one_and_update(
-        {"_id": ObjectId(id), "batches.batch_id": batch_id},
+        {
+            "_id": ObjectId(id),
+            "batches": {"$elemMatch": {
+                "batch_id": batch_id,
+                "facetime_sessions.module": {"$ne": data.module}
+            }}
+        },
         {"$push": {"batches.$.facetime_sessions": data.dict()}},
         {"_id": 0, "batches": {"$elemMatch": {"batch_id": batch_id}}},
         return_document=ReturnDocument.AFTER
     )
-    print(rs)
+    if not rs:
+        return None
     count = len(rs['batches'][0]['facetime_sessions'])
     return rs['batches'][0]['facetime_sessions'][count -1]
 
@@ -333,21 +452,17 @@ async def add_clients(db: DBClient, ref: str, data: List[GuestCreate]):
     logging.info(f">>> {__name__}:{add_clients.__name__}")
 
     collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
-    modified_count = 0
-    # Manually one by one
-    # TODO:
-    for x in data:
+    hashes = await hasher.hash_many([x.password for x in data])
+    members = []
+    for x, hashed_password in zip(data, hashes):
         dic = x.dict()
         dic["role"] = "client"
-        dic["hashed_password"] = get_password_hash(x.password)
+        dic["hashed_password"] = hashed_password
         del dic["password"]
-        rs = await collection.update_one(
-            {"_id": ObjectId(ref)},
-            {"$push": {"members": dic}}
-        )
-        modified_count += rs.modified_count
-    logging.info("Modified: " + str(modified_count))
-    if rs.modified_count > 0:
+        members.append(dic)
+    rs = await utils.push_many(collection, ref, "members", members)
+    logging.info("Modified: " + str(len(rs.succeeded)))
+    if rs.succeeded:
         return data
 
 
@@ -373,19 +488,20 @@ async def _add_batch(db: DBClient, id: str, data: BatchBase):
 
 async def add_module(db: DBClient, id: str, data: Workbook,
 facetime: bool=False):
-    """Add one or more modules"""
+    """Add a module, returns None when its type is already in the project"""
     logging.info(f">>> {__name__}:{add_module.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
     group = "workbooks"
     if facetime:
         group = "facetimes"
     rs = await collection.find_one_and_update(
-        {"_id": ObjectId(id)},
+        {"_id": ObjectId(id), group + ".type": {"$ne": data.type}},
         {"$push": {group: data.dict()}},
         {"_id": 0, group: {"$elemMatch": {"type": data.type}}},
         return_document=ReturnDocument.AFTER
     )
-    print(rs)
+    if not rs:
+        return None
     return rs[group][0]
 
 
@@ -457,31 +573,18 @@ async def get_modules(db: DBClient, id: str, type: str=""):
         {"_id": ObjectId(id)},
         {"_id": 0, "workbooks": 1, "facetimes": 1}
     )
-    workbooks = rs['workbooks']
-    facetimes = rs['facetimes']
-    modules = workbooks + facetimes
-    if type == "workbook":
-        return workbooks
-    elif type == "facetime":
-        return facetimes
-    return modules
+    return select_modules(rs, type)
 
 
 async def add_modules(db: DBClient, ref: str, data: List[Workbook]):
     """Add one or more modules"""
     logging.info(f">>> {__name__}:{add_modules.__name__}")
     collection = utils.get_collection(db, config.DOCTYPE_PROJECT)
-    modified_count = 0
-    # Manually one by one
-    # TODO:
-    for x in data:
-        rs = await collection.update_one(
-            {"_id": ObjectId(ref)},
-            {"$push": {"modules": x.dict()}}
-        )
-        modified_count += rs.modified_count
-    logging.info("Modified: " + str(modified_count))
-    if rs.modified_count > 0:
+    rs = await utils.push_many(
+        collection, ref, "modules", [x.dict() for x in data]
+    )
+    logging.info("Modified: " + str(len(rs.succeeded)))
+    if rs.succeeded:
         return data
 
 
@@ -566,3 +669,12 @@ async def prepare_persona_evidences(db: DBClient, id: str, batch_id: str):
             'type': a['module'],
             'items': a['module_items']
         })
+
+    # Evidences are materialized when each persona begins, here we only
+    # hand out their (derived) ids
+    return {
+        "batteries": batteries,
+        "evidences": [
+            {"username": x, "id": str(evidence_id(id, x))} for x in usernames
+        ]
+    }
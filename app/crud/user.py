@@ -5,12 +5,16 @@ from bson.objectid import ObjectId
 from email_validator import validate_email
 
 from app.core import config
-from app.core.security import get_password_hash, verify_password
+from app.core.jwt import forget_token_version
+from app.core.security import hasher
 from app.crud import utils
 from app.db.mongo import AsyncIOMotorClient as DBClient
 from app.models.user import User, UserInApp, UserInDB, UserCreate, UserUpdate
 from app.models.role import RoleEnum
 
+# Changing any of these invalidates the user's access tokens
+REVOKING_FIELDS = ("hashed_password", "disabled", "type", "admin_roles")
+
 
 async def authenticate(db: DBClient, username: str, password: str):
     logging.info(f">>> {__name__}:{authenticate.__name__}")
@@ -18,7 +22,7 @@ async def authenticate(db: DBClient, username: str, password: str):
     user = await collection.find_one({"username": username, "type": "gaia",})
     if not user:
         return None
-    if not verify_password(password, user['hashed_password']):
+    if not await hasher.verify(password, user['hashed_password']):
         return None
     return user
 
@@ -37,7 +41,7 @@ async def authenticate_licensee(
     )
     if not user:
         return None
-    if not verify_password(password, user['hashed_password']):
+    if not await hasher.verify(password, user['hashed_password']):
         return None
     return user
 
@@ -111,10 +115,12 @@ async def get(db: DBClient, ref: str):
     return await utils.get(collection, ref, "username")
 
 
-async def get_multi(db: DBClient, limit: int = 50, skip: int = 0):
+async def get_multi(db: DBClient, limit: int = 50, skip: int = 0,
+cursor: str = None, projection: dict = None):
     logging.info(">>> " + __name__ + ":" + get_multi.__name__ )
     collection = utils.get_collection(db, config.DOCTYPE_USER)
-    return await utils.get_multi(collection, limit, skip)
+    return await utils.get_multi(collection, limit, skip, cursor,
+        projection=projection)
 
 
 async def get_multi_by_filter(db: DBClient, limit: int = 50, skip: int = 0):
@@ -126,7 +132,7 @@ async def get_multi_by_filter(db: DBClient, limit: int = 50, skip: int = 0):
 async def create(db: DBClient, data: UserCreate):
     logging.info(">>> " + __name__ + ":" + create.__name__ )
     collection = utils.get_collection(db, config.DOCTYPE_USER)
-    passwordhash = get_password_hash(data.password)
+    passwordhash = await hasher.hash(data.password)
     user = UserInDB(**data.dict(), hashed_password=passwordhash)
     return await utils.create(collection, user)
 
@@ -135,20 +141,39 @@ async def create_many(db: DBClient, users: List[UserCreate]):
     logging.info(">>> " + __name__ + ":" + create_many.__name__ )
     collection = utils.get_collection(db, config.DOCTYPE_USER)
     data = []
-    for x in users:
+    hashes = await hasher.hash_many([x.password for x in users])
+    for x, hashed_password in zip(users, hashes):
         dic = x.dict()
-        dic["hashed_password"] = get_password_hash(x.password)
-        print(dic)
+        dic["hashed_password"] = hashed_password
         data.append(dic)
-    rs = await collection.insert_many(data)
-    ids = []
-    for i in rs.inserted_ids:
-        ids.append(str(i))
-    return ids
+    # Per-user {"index", "id", "error"}, duplicates don't abort the batch
+    return await utils.insert_many(collection, data)
 
 
 # TODO not finished yet
 async def update(db: DBClient, id:str, data: User):
-    logging.info(">>> " + __name__ + ":" + create.__name__ )
+    """
+    Returns a `WriteResult`. A new `password` is stored hashed, tokens are
+    revoked only when the password, disabled flag, type or roles change.
+    """
+    logging.info(">>> " + __name__ + ":" + update.__name__ )
     collection = utils.get_collection(db, config.DOCTYPE_USER)
-    return await utils.update(collection, id=id, data=data)
+    _dict = data.dict()
+    password = _dict.pop("password", None)
+    if password:
+        _dict["hashed_password"] = await hasher.hash(password)
+    rs = await utils.update(collection, id, _dict)
+    if set(rs.changed) & set(REVOKING_FIELDS):
+        await revoke_tokens(db, rs.doc['username'])
+    return rs
+
+
+async def revoke_tokens(db: DBClient, username: str):
+    """Invalidate every access token issued to the user"""
+    logging.info(">>> " + __name__ + ":" + revoke_tokens.__name__ )
+    collection = utils.get_collection(db, config.DOCTYPE_USER)
+    await collection.update_one(
+        {"username": username},
+        {"$inc": {"token_version": 1}}
+    )
+    forget_token_version(username)
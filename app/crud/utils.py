@@ -1,13 +1,20 @@
+import asyncio
 import logging
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from enum import Enum
-from typing import Dict, List, Optional, Sequence, Type, TypeVar, Union
+from typing import (Awaitable, Callable, Dict, List, Optional, Sequence,
+                    Type, TypeVar, Union)
 
 from pydantic import BaseModel
+from bson import json_util
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
+from fastapi import HTTPException
 from motor.motor_asyncio import AsyncIOMotorCollection as Collection
-from pymongo import ReturnDocument
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 
-from app.db.mongo import AsyncIOMotorClient
+from app.db.mongo import AsyncIOMotorClient, get_database
 from app.core.config import MONGODB_NAME
 
 
@@ -26,12 +33,13 @@ def ensure_enums_to_strs(items: Union[Sequence[Union[Enum, str]], Type[Enum]]):
     return str_items
 
 
-async def get(collection: Collection, seek: str, field="_id"):
+async def get(collection: Collection, seek: str, field="_id",
+    projection: Dict = None):
     logging.info(">>> " + __name__ + ":" + get.__name__ )
     if field == "_id":
-        return await collection.find_one({"_id": ObjectId(seek)})
+        return await collection.find_one({"_id": ObjectId(seek)}, projection)
     else:
-        return await collection.find_one({field: seek})
+        return await collection.find_one({field: seek}, projection)
 
 
 async def get_by_dict(collection: Collection, fields: dict):
@@ -40,65 +48,220 @@ async def get_by_dict(collection: Collection, fields: dict):
     return await collection.find_one(fields)
 
 
-async def get_multi(collection: Collection, limit: int = 20, skip: int = 0):
+class Page(list):
+    """List of documents plus the token for the page after it"""
+    next_cursor: Optional[str] = None
+
+
+def encode_cursor(doc: dict, sort_key: str = "_id"):
+    """Opaque continuation token pointing just past `doc`"""
+    position = {"id": doc["_id"], "k": doc.get(sort_key)}
+    raw = json_util.dumps(position).encode()
+    return urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str):
+    try:
+        raw = urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        position = json_util.loads(raw.decode())
+        return position["k"], position["id"]
+    except Exception:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+def after_cursor(filter: Dict, cursor: str, sort_key: str = "_id"):
+    """Narrow `filter` to documents sorted after the cursor position"""
+    value, last_id = decode_cursor(cursor)
+    if sort_key == "_id":
+        cond = {"_id": {"$gt": last_id}}
+    else:
+        cond = {"$or": [
+            {sort_key: {"$gt": value}},
+            {sort_key: value, "_id": {"$gt": last_id}}
+        ]}
+    if not filter:
+        return cond
+    return {"$and": [filter, cond]}
+
+
+async def get_multi(
+    collection: Collection, limit: int = 20, skip: int = 0,
+    cursor: str = None, sort_key: str = "_id", projection: Dict = None
+    ):
     logging.info(">>> " + __name__ + ":" + get_multi.__name__ )
-    rs: List[BaseModel] = []
-    cursor = collection.find({}, limit=limit, skip=skip)
-    async for row in cursor:
-        rs.append(row)
-    return rs
+    return await get_multi_by_filter(
+        collection, {}, limit, skip, cursor, sort_key, projection
+    )
 
 
 async def get_multi_by_filter(
-    collection: Collection, filter: Dict, limit: int = 20, skip: int = 0
+    collection: Collection, filter: Dict, limit: int = 20, skip: int = 0,
+    cursor: str = None, sort_key: str = "_id", projection: Dict = None
     ):
-    """Example: filter = { "phone": "123" }"""
+    """
+    Example: filter = { "phone": "123" }
+
+    Pages are ordered by `sort_key` (then `_id`). Pass the previous page's
+    `next_cursor` as `cursor` to continue without skipping documents;
+    `skip` is only honoured when no cursor is given.
+    `projection` limits the returned fields (see `model_projection`).
+    """
     logging.info(">>> " + __name__ + ":" + get_multi_by_filter.__name__ )
-    rs: List[BaseModel] = []
-    cursor = collection.find(filter=filter, limit=limit, skip=skip)
-    async for row in cursor:
+    sort = [(sort_key, 1)]
+    if sort_key != "_id":
+        sort.append(("_id", 1))
+    if cursor:
+        filter = after_cursor(filter, cursor, sort_key)
+        skip = 0
+    if projection and sort_key not in projection:
+        projection = {**projection, sort_key: 1}
+    rs = Page()
+    rows = collection.find(filter=filter, projection=projection, sort=sort,
+        limit=limit, skip=skip)
+    async for row in rows:
         rs.append(row)
+    if limit and len(rs) == limit:
+        rs.next_cursor = encode_cursor(rs[-1], sort_key)
     return rs
 
 
 async def create(collection: Collection, data: BaseModel):
+    """Insert and return the new document, `_id` included"""
     logging.info(">>> " + __name__ + ":" + create.__name__ )
     _dict = data.dict()
     try:
         logging.info("Trying to insert new document...")
         rs = await collection.insert_one(_dict)
         if rs.inserted_id:
-            return await collection.find_one({"_id": rs.inserted_id})
+            # insert_one has set _dict["_id"]
+            return _dict
     except Exception as e:
         logging.error("Failed: " + str(e))
     return None
 
 
-async def update(collection: Collection, id: str, data: BaseModel):
+class BulkResult(list):
+    """
+    Per-item outcome of a bulk write, in input order.
+    Each entry is `{"index", "id", "error"}`, `error` is None on success.
+    `matched` and `upserted` are the server's counts for the whole batch.
+    """
+    matched = 0
+    upserted = 0
+
+    @property
+    def succeeded(self):
+        return [x for x in self if x["error"] is None]
+
+    @property
+    def failed(self):
+        return [x for x in self if x["error"] is not None]
+
+
+async def bulk_write(collection: Collection, requests: List, ids: List = None):
+    """
+    Unordered `bulk_write`: one round trip, a failing item does not stop
+    the others. `ids` (optional) labels each request in the result.
+    """
+    logging.info(">>> " + __name__ + ":" + bulk_write.__name__ )
+    rs = BulkResult(
+        {"index": i, "id": ids[i] if ids else None, "error": None}
+        for i in range(len(requests))
+    )
+    if not requests:
+        return rs
+    try:
+        result = await collection.bulk_write(requests, ordered=False)
+        rs.matched = result.matched_count
+        rs.upserted = result.upserted_count
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            rs[err["index"]]["error"] = err.get("errmsg", "Write failed")
+        rs.matched = e.details.get("nMatched", 0)
+        rs.upserted = e.details.get("nUpserted", 0)
+        logging.info("Failed: " + str(len(rs.failed)))
+    return rs
+
+
+async def insert_many(collection: Collection, docs: List[Dict]):
+    """Insert `docs` in one unordered batch, see `bulk_write`"""
+    logging.info(">>> " + __name__ + ":" + insert_many.__name__ )
+    for doc in docs:
+        doc.setdefault("_id", ObjectId())
+    return await bulk_write(
+        collection,
+        [InsertOne(doc) for doc in docs],
+        [str(doc["_id"]) for doc in docs]
+    )
+
+
+async def push_many(collection: Collection, id: str, field: str,
+    items: List[Dict]):
+    """
+    Append `items` to the `field` array of one document with `$push` and
+    `$each`, a single round trip whatever the number of items.
+    """
+    logging.info(">>> " + __name__ + ":" + push_many.__name__ )
+    rs = BulkResult(
+        {"index": i, "id": None, "error": None} for i in range(len(items))
+    )
+    if not items:
+        return rs
+    updated = await collection.update_one(
+        {"_id": ObjectId(id)},
+        {"$push": {field: {"$each": items}}}
+    )
+    if not updated.matched_count:
+        for x in rs:
+            x["error"] = "Document not found"
+    return rs
+
+
+class WriteResult:
+    """
+    Outcome of `update`: `found` is False when nothing matched, `modified`
+    is False when the document already held the given values. `doc` is
+    the document after the update, `changed` the names of fields whose
+    value changed.
+    """
+
+    def __init__(self, doc: Dict = None, found: bool = False,
+        modified: bool = False, changed: List[str] = None):
+        self.doc = doc
+        self.found = found
+        self.modified = modified
+        self.changed = changed or []
+
+
+async def update(collection: Collection, seek: str,
+    data: Union[BaseModel, Dict], field="_id"):
+    """
+    Set the non-empty fields of `data` in one `find_one_and_update`.
+    The pre-image comes back, the post-image and `modified` are derived
+    from it, so no extra read is needed.
+    """
     logging.info(">>> " + __name__ + ":" + update.__name__ )
-    found = await collection.find_one({"_id": ObjectId(id)}, {"_id": 1})
-    if found:
-        _dict = data.dict()
-        excludes = []  # TODO
-        for k in _dict:
-            if not _dict[k]:
-                excludes.append(k)
-        print(excludes)
-        for i in excludes:
-            del _dict[i]
-
-        # rs = await collection.update_one(
-        #         {"_id": ObjectId(id)},
-        #         {"$set": _dict}
-        #     )
-        # if rs.modified_count:
-        #     return await collection.find_one({"_id": ObjectId(id)})
-        return await collection.find_one_and_update(
-            {"_id": ObjectId(id)},
-            {"$set": _dict},
-            return_document=ReturnDocument.AFTER
-        )
-    return None
+    filter = {"_id": ObjectId(seek)} if field == "_id" else {field: seek}
+    _dict = data.dict() if isinstance(data, BaseModel) else dict(data)
+    excludes = []  # TODO
+    for k in _dict:
+        if not _dict[k]:
+            excludes.append(k)
+    for i in excludes:
+        del _dict[i]
+
+    if not _dict:
+        doc = await collection.find_one(filter)
+        return WriteResult(doc, doc is not None, False)
+    before = await collection.find_one_and_update(
+        filter,
+        {"$set": _dict},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        return WriteResult()
+    changed = [k for k, v in _dict.items() if before.get(k) != v]
+    return WriteResult({**before, **_dict}, True, bool(changed), changed)
 
 
 async def delete(collection: Collection, id: str):
@@ -107,3 +270,170 @@ async def delete(collection: Collection, id: str):
         return deleted
     return None
 
+
+
+def doc_id(id: Union[str, ObjectId]):
+    """
+    `_id` of a document keyed by `id`: 24-hex strings are ObjectIds,
+    other strings are used as they are. `ObjectId.is_valid` is not used,
+    it also accepts any 12-character string.
+    """
+    if isinstance(id, str) and len(id) == 24:
+        try:
+            return ObjectId(id)
+        except InvalidId:
+            pass
+    return id
+
+
+class WriteBehind:
+    """
+    Per-worker buffer of updates keyed by document id.
+
+    Updates to the same document are merged (`$inc` values are summed,
+    `$max` keeps the larger value, other operators keep the last value),
+    and the buffer is written as one unordered `bulk_write` once it holds
+    `max_rows` updates or `interval_ms` after the first one, whichever
+    comes first. `wait=True` returns once the batch holding the update is
+    written. Ids are turned into `_id`s by `doc_id`.
+    `filter` is added to every update's `_id` filter, documents that do
+    not match it are left as they are and their updates count as failed.
+    `on_written` callbacks run only once their update has been written.
+    """
+
+    def __init__(self, doc_type: str, max_rows: int, interval_ms: int,
+        upsert: bool = False, filter: Dict = None):
+        self.doc_type = doc_type
+        self.max_rows = max_rows
+        self.interval = interval_ms / 1000
+        self.upsert = upsert
+        self.filter = filter or {}
+        self._pending = {}
+        self._waiters = {}
+        self._callbacks = {}
+        self._rows = 0
+        self._timer = None
+        self._tasks = set()
+        self._writes = set()
+
+    async def add(self, id: str, fields: Dict, wait: bool = False):
+        """Buffer a `$set`, returns False when a waited-for write failed"""
+        return await self.add_update(id, {"$set": fields}, wait)
+
+    async def add_update(self, id: str, update: Dict, wait: bool = False,
+        on_written: Callable[[], Awaitable] = None):
+        """Buffer an update document such as `{"$inc": {...}}`"""
+        pending = self._pending.setdefault(id, {})
+        for op, fields in update.items():
+            merged = pending.setdefault(op, {})
+            for k, v in fields.items():
+                if op == "$inc":
+                    merged[k] = merged.get(k, 0) + v
+                elif op == "$max" and k in merged:
+                    merged[k] = max(merged[k], v)
+                else:
+                    merged[k] = v
+        self._rows += 1
+        if on_written:
+            self._callbacks.setdefault(id, []).append(on_written)
+        waiter = None
+        if wait:
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiters.setdefault(id, []).append(waiter)
+        if self._rows >= self.max_rows:
+            self._schedule(0)
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(
+                self.interval, self._schedule, 0
+            )
+        if waiter:
+            return await waiter
+        return True
+
+    def _schedule(self, _):
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        """
+        Write the buffer, returns once every earlier write is done too.
+        False when any of those writes failed or matched no document.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # A timer flush may have taken the buffer and still be writing it
+        writes = list(self._writes)
+        if self._pending:
+            pending, waiters = self._pending, self._waiters
+            callbacks = self._callbacks
+            self._pending, self._waiters, self._rows = {}, {}, 0
+            self._callbacks = {}
+            write = asyncio.ensure_future(
+                self._write(pending, waiters, callbacks)
+            )
+            self._writes.add(write)
+            write.add_done_callback(self._writes.discard)
+            writes.append(write)
+        if not writes:
+            return True
+        results = await asyncio.gather(*writes, return_exceptions=True)
+        return all(x is True for x in results)
+
+    async def _unmatched(self, collection: Collection, ids: List[str]):
+        """
+        Which of `ids` the filter does not match. Bulk results only count
+        matches per batch, so this is read back when the counts fall short.
+        """
+        keys = {doc_id(id): id for id in ids}
+        cursor = collection.find(
+            {"_id": {"$in": list(keys)}, **self.filter}, {"_id": 1}
+        )
+        matched = set([keys[x["_id"]] async for x in cursor])
+        return set(id for id in ids if id not in matched)
+
+    async def _write(self, pending: Dict, waiters: Dict, callbacks: Dict):
+        ids = list(pending)
+        requests = [
+            UpdateOne(
+                {
+                    "_id": doc_id(id),
+                    **self.filter
+                },
+                pending[id], upsert=self.upsert
+            )
+            for id in ids
+        ]
+        collection = get_collection(get_database(), self.doc_type)
+        try:
+            rs = await bulk_write(collection, requests, ids)
+            failed = set(x["id"] for x in rs.failed)
+            if rs.matched + rs.upserted < len(ids) - len(failed):
+                failed |= await self._unmatched(
+                    collection, [id for id in ids if id not in failed]
+                )
+        except Exception as e:
+            logging.error("Write-behind flush failed: " + str(e))
+            failed = set(ids)
+        if failed:
+            logging.info(f"Write-behind: {len(failed)} updates not written")
+        for id, fns in callbacks.items():
+            if id in failed:
+                continue
+            for fn in fns:
+                try:
+                    await fn()
+                except Exception as e:
+                    logging.error("Write-behind callback failed: " + str(e))
+        for id, futures in waiters.items():
+            for f in futures:
+                if not f.done():
+                    f.set_result(id not in failed)
+        return not failed
+
+    async def close(self):
+        """Write whatever is buffered, used on shutdown"""
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
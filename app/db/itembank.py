@@ -0,0 +1,131 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, List, Optional
+
+from app.core import config
+
+"""
+Item banks: the text of a workbook's items, one read-only file per
+workbook type and version (`gpq-1.bank`), mapped once per worker.
+
+    header   "<4sHH"  magic, items, options per item
+    index    "<IH6s"  per (wb_seq, option): text offset, text length,
+                      element code (NUL padded)
+    texts    UTF-8 statements
+
+Entry of (wb_seq, option) is at (wb_seq - 1) * options + option, so a
+lookup is one `struct.unpack_from` on the mapping. Build a bank with
+
+    python -m app.db.itembank source.json
+
+where source.json is {"type", "version", "items": [[{"element",
+"statement"}, ...], ...]} with items in wb_seq order.
+"""
+
+MAGIC = b"GIB1"
+HEADER = struct.Struct("<4sHH")
+ENTRY = struct.Struct("<IH6s")
+
+
+class ItemBank:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.items, self.options = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("Not an item bank: " + path)
+        self._texts = HEADER.size + ENTRY.size * self.items * self.options
+
+    def _entry(self, wb_seq: int, option: int):
+        if not (1 <= wb_seq <= self.items and 0 <= option < self.options):
+            raise KeyError((wb_seq, option))
+        pos = HEADER.size + ENTRY.size * ((wb_seq - 1) * self.options + option)
+        return ENTRY.unpack_from(self._map, pos)
+
+    def element(self, wb_seq: int, option: int) -> str:
+        return self._entry(wb_seq, option)[2].rstrip(b"\0").decode()
+
+    def statement(self, wb_seq: int, option: int) -> str:
+        offset, length, _ = self._entry(wb_seq, option)
+        start = self._texts + offset
+        return self._map[start:start + length].decode("utf-8")
+
+    def close(self):
+        self._map.close()
+
+
+def write_bank(path: str, items: List[List[Dict]]):
+    """`items[wb_seq - 1][option]` is {"element", "statement"}"""
+    options = max(len(x) for x in items)
+    index, texts = [], bytearray()
+    for item in items:
+        for option in range(options):
+            row = item[option] if option < len(item) else {}
+            text = (row.get("statement") or "").encode("utf-8")
+            index.append(ENTRY.pack(
+                len(texts), len(text), (row.get("element") or "").encode()
+            ))
+            texts += text
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(items), options))
+        f.write(b"".join(index))
+        f.write(texts)
+
+
+def bank_path(type: str, version: str):
+    return os.path.join(config.ITEM_BANK_DIR, f"{type.lower()}-{version}.bank")
+
+
+_banks = {}
+
+
+def get_bank(type: str, version: str) -> Optional[ItemBank]:
+    """The worker's mapping of a bank, None when there is no such file"""
+    key = (type.lower(), version)
+    if key not in _banks:
+        path = bank_path(type, version)
+        _banks[key] = ItemBank(path) if os.path.exists(path) else None
+        if _banks[key]:
+            logging.info(f"Mapped item bank {path}")
+    return _banks[key]
+
+
+def resolve_rows(rows: List[Dict], bank: Optional[ItemBank]):
+    """Fill `statement` (and `element`) of rows answered by option"""
+    if bank is None:
+        return rows
+    for row in rows:
+        if row.get("option") is None or not row.get("wb_seq"):
+            continue
+        try:
+            if not row.get("statement"):
+                row["statement"] = bank.statement(row["wb_seq"], row["option"])
+            if not row.get("element"):
+                row["element"] = bank.element(row["wb_seq"], row["option"])
+        except KeyError:
+            pass
+    return rows
+
+
+def close_banks():
+    for bank in _banks.values():
+        if bank:
+            bank.close()
+    _banks.clear()
+
+
+def main():
+    with open(sys.argv[1]) as f:
+        source = json.load(f)
+    path = bank_path(source["type"], source["version"])
+    write_bank(path, source["items"])
+    print(f"{path}: {len(source['items'])} items")
+
+
+if __name__ == "__main__":
+    main()
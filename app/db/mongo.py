@@ -1,6 +1,11 @@
+import hashlib
 import logging
+import os
+from datetime import datetime, timedelta
 
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from app.core import config
 
 
@@ -15,6 +20,49 @@ def get_database() -> AsyncIOMotorClient:
     return db.client
 
 
+"""
+Index registry: one declarative spec per collection.
+Names are stable, they are how reconciliation recognizes an index.
+`(prj_id, username)` on ev_gpq also serves `prj_id`-only lookups.
+"""
+INDEXES = {
+    config.DOCTYPE_USER: [
+        {"name": "username_index", "keys": [("username", 1)], "unique": True},
+        {"name": "email_index", "keys": [("email", 1)], "unique": True},
+    ],
+    config.DOCTYPE_COMPANY: [
+        {
+            "name": "creator_symbol_index",
+            "keys": [("created_by", 1), ("symbol", 1)],
+            "unique": True
+        },
+    ],
+    config.DOCTYPE_PERSONA: [
+        {
+            "name": "projectid_username_index",
+            "keys": [("prj_id", 1), ("username", 1)],
+            "unique": True
+        },
+    ],
+    config.DOCTYPE_PROJECT: [
+        {"name": "owner_index", "keys": [("owner", 1)]},
+        {"name": "lead_by_index", "keys": [("lead_by", 1)]},
+        {"name": "members_username_index", "keys": [("members.username", 1)]},
+        {"name": "batches_batch_id_index", "keys": [("batches.batch_id", 1)]},
+    ],
+    config.DOCTYPE_EV_GPQ: [
+        {
+            "name": "projectid_username_index",
+            "keys": [("prj_id", 1), ("username", 1)],
+            "unique": True
+        },
+    ],
+    config.DOCTYPE_GPQ_TIMING: [
+        {"name": "projectid_index", "keys": [("prj_id", 1)]},
+    ],
+}
+
+
 async def connect_to_mongo():
     logging.info("Connecting to Mongo...")
     db.client = AsyncIOMotorClient(
@@ -24,11 +72,7 @@ async def connect_to_mongo():
         )
     logging.info("Connected.")
 
-    # TODO init indexes
-    await init_user_indexes(db.client)
-    await init_company_indexes(db.client)
-    await init_persona_indexes(db.client)
-    # await init_project_indexes(db.client)
+    await ensure_indexes(db.client)
 
 
 async def close_connection():
@@ -37,85 +81,186 @@ async def close_connection():
     logging.info("Connection closed.")
 
 
-async def init_user_indexes(db: AsyncIOMotorClient):
-    logging.info(f">>> {__name__}:{init_user_indexes.__name__}")
-    logging.info(">>> Checking user indexes...")
-    # db_name = config.MONGODB_NAME
-    collection = db[config.MONGODB_NAME][config.DOCTYPE_USER]
-    # collection = db['behavioral_db']['users']
-    info = await collection.index_information()
-    index_name = "username_index"
-    if index_name in info:
-        logging.info(f"Found index: {index_name}")
-    else:
-        logging.info(f"Index not found, creating index: {index_name}")
-        await collection.create_index(
-            [("username", 1)],
-            unique=True,
-            name=index_name
-        )
-    index_name = "email_index"
-    if index_name in info:
-        logging.info(f"Found index: {index_name}")
-    else:
-        logging.info(f"Index not found, creating index: {index_name}")
-        await collection.create_index(
-            [("email", 1)],
-            unique=True,
-            name=index_name
-        )
+def index_model(spec: dict):
+    options = {k: v for k, v in spec.items() if k != "keys"}
+    return IndexModel(spec["keys"], background=True, **options)
 
 
-async def init_company_indexes(db: AsyncIOMotorClient):
-    logging.info(f">>> {__name__}:{init_company_indexes.__name__}")
-    logging.info(">>> Checking company indexes...")
-    collection = db[config.MONGODB_NAME][config.DOCTYPE_COMPANY]
-    info = await collection.index_information()
-    index_name = "creator_symbol_index"
-    if index_name in info:
-        logging.info(f"Found index: {index_name}")
-    else:
-        logging.info(f"Index not found, creating index: {index_name}")
-        await collection.create_index(
-            [("created_by", 1), ("symbol", 1)],
-            unique=True,
-            name=index_name
-        )
+class IndexConflict(RuntimeError):
+    """A unique index cannot be built over the stored documents"""
 
 
-async def init_project_indexes(db: AsyncIOMotorClient):
-    logging.info(">>> " + __name__ + ":" + init_project_indexes.__name__ )
-    logging.info("Cheking project indexes...")
-    collection = db[config.MONGODB_NAME][config.DOCTYPE_PROJECT]
-
-    info = await collection.index_information()
-    index_name = "project_complex_index"
-    if index_name in info:
-        logging.info("Found " + index_name)
-    else:
-        logging.info("Index not found, creating one...")
-        await collection.create_index(
-            [("batches.batch_id", 1), ("batches.workbook_sessions.workbook", 1)],
-            unique=True,
-            name=index_name
-        )
+async def find_duplicates(collection, keys: list, limit: int = 10):
+    """Up to `limit` key values held by more than one document"""
+    pipeline = [
+        {"$group": {
+            "_id": {k.replace(".", "_"): "$" + k for k, _ in keys},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": limit},
+    ]
+    cursor = collection.aggregate(pipeline, allowDiskUse=True)
+    return [x async for x in cursor]
+
+
+async def reconcile_indexes(client: AsyncIOMotorClient):
+    """
+    Compare INDEXES with what exists, one `index_information` call per
+    collection, and build whatever is missing in the background.
+    An index whose `unique` option differs is dropped and rebuilt, unless
+    duplicates would break the unique build: then IndexConflict is raised
+    and they have to be resolved first. Other existing indexes are never
+    dropped here, see `index_report`.
+    """
+    logging.info(f">>> {__name__}:{reconcile_indexes.__name__}")
+    for doc_type, specs in INDEXES.items():
+        collection = client[config.MONGODB_NAME][doc_type]
+        info = await collection.index_information()
+        missing, rebuilt = [], []
+        for spec in specs:
+            found = info.get(spec["name"])
+            if not found:
+                missing.append(spec)
+            elif list(found["key"]) != list(spec["keys"]):
+                logging.warning(
+                    f"Index {doc_type}.{spec['name']} differs from spec: "
+                    f"{found['key']} != {spec['keys']}"
+                )
+            elif found.get("unique", False) != spec.get("unique", False):
+                if spec.get("unique"):
+                    duplicates = await find_duplicates(collection, spec["keys"])
+                    if duplicates:
+                        raise IndexConflict(
+                            f"Index {doc_type}.{spec['name']} must be unique, "
+                            f"resolve duplicates first: {duplicates}"
+                        )
+                logging.info(f"Dropping {doc_type}.{spec['name']} to rebuild it")
+                await collection.drop_index(spec["name"])
+                missing.append(spec)
+                rebuilt.append(spec["name"])
+        if missing:
+            names = [spec["name"] for spec in missing]
+            logging.info(f"Creating indexes on {doc_type}: {names}")
+            try:
+                await collection.create_indexes(
+                    [index_model(x) for x in missing]
+                )
+            except Exception as e:
+                if rebuilt:
+                    # Written meanwhile, the index is gone until resolved
+                    raise IndexConflict(
+                        f"Rebuilding {doc_type} {rebuilt} failed: {e}"
+                    )
+                raise
+        else:
+            logging.info(f"Indexes on {doc_type} are up to date")
+
+
+INDEX_SCHEMA_ID = "index_schema"
+INDEX_LOCK_SECONDS = 300
+
 
+def index_schema_version():
+    """Fingerprint of INDEXES, changes whenever the registry does"""
+    return hashlib.sha1(repr(sorted(INDEXES.items())).encode()).hexdigest()
 
-async def init_persona_indexes(db: AsyncIOMotorClient):
-    logging.info(">>> " + __name__ + ":" + init_persona_indexes.__name__ )
-    logging.info("Cheking persona indexes...")
-    collection = db[config.MONGODB_NAME][config.DOCTYPE_PERSONA]
-
-    info = await collection.index_information()
-    index_name = "projectid_username_index"
-    if index_name in info:
-        logging.info("Found " + index_name)
-    else:
-        logging.info("Index not found, creating one...")
-        await collection.create_index(
-            [("prj_id", 1), ("username", 1)],
-            unique=True,
-            name=index_name
+
+async def ensure_indexes(client: AsyncIOMotorClient):
+    """
+    Reconcile indexes at most once per registry version across workers.
+
+    A worker that finds the current version in the meta collection is
+    done after one small read. Otherwise the first worker to take the
+    lock reconciles and records the version, the others skip.
+    """
+    logging.info(f">>> {__name__}:{ensure_indexes.__name__}")
+    meta = client[config.MONGODB_NAME][config.DOCTYPE_META]
+    version = index_schema_version()
+    marker = await meta.find_one({"_id": INDEX_SCHEMA_ID})
+    if marker and marker.get("version") == version:
+        logging.info("Index schema is current, skipping reconciliation")
+        return
+
+    now = datetime.utcnow()
+    owner = f"{os.uname()[1]}:{os.getpid()}"
+    try:
+        await meta.find_one_and_update(
+            {
+                "_id": INDEX_SCHEMA_ID,
+                "$or": [
+                    {"locked_until": None},
+                    {"locked_until": {"$lt": now}}
+                ]
+            },
+            {"$set": {
+                "locked_by": owner,
+                "locked_until": now + timedelta(seconds=INDEX_LOCK_SECONDS)
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        logging.info("Another worker is reconciling indexes")
+        return
+
+    try:
+        await reconcile_indexes(client)
+        await meta.update_one(
+            {"_id": INDEX_SCHEMA_ID},
+            {
+                "$set": {"version": version, "updated": datetime.utcnow()},
+                "$unset": {"locked_by": "", "locked_until": ""}
+            }
         )
+    except Exception as e:
+        logging.error("Index reconciliation failed: " + str(e))
+        await meta.update_one(
+            {"_id": INDEX_SCHEMA_ID},
+            {"$unset": {"locked_by": "", "locked_until": ""}}
+        )
+        # Routes rely on unique indexes, do not start without them
+        if isinstance(e, IndexConflict):
+            raise
+
+
+def is_prefix(keys: list, other: list):
+    return len(keys) < len(other) and other[:len(keys)] == keys
+
+
+async def index_report(client: AsyncIOMotorClient):
+    """
+    Per collection: declared indexes that are missing, indexes not in
+    INDEXES, indexes made redundant by a longer index with the same
+    prefix (unique ones excepted), and indexes with no recorded use since
+    the server started.
+    """
+    logging.info(f">>> {__name__}:{index_report.__name__}")
+    report = {}
+    for doc_type, specs in INDEXES.items():
+        collection = client[config.MONGODB_NAME][doc_type]
+        info = await collection.index_information()
+        declared = [spec["name"] for spec in specs]
+        keys = {name: list(x["key"]) for name, x in info.items()}
 
+        usage = {}
+        async for row in collection.aggregate([{"$indexStats": {}}]):
+            usage[row["name"]] = row["accesses"]["ops"]
 
+        report[doc_type] = {
+            "missing": [name for name in declared if name not in info],
+            "undeclared": [
+                name for name in info if name != "_id_" and name not in declared
+            ],
+            "redundant": [
+                name for name in keys
+                if name != "_id_" and not info[name].get("unique") and any(
+                    is_prefix(keys[name], keys[other]) for other in keys
+                )
+            ],
+            "unused": [
+                name for name, ops in usage.items()
+                if name != "_id_" and ops == 0
+            ],
+        }
+    return report
@@ -0,0 +1,115 @@
+import logging
+from time import time
+from typing import Dict, List
+
+from cachetools import LRUCache
+
+from app.core import config
+from app.core.events import progress_bus
+from app.crud.gpq import get_touched as get_gpq_touched
+from app.crud.persona import get_progress as get_personas_progress
+from app.db.mongo import AsyncIOMotorClient as DBClient
+
+"""
+Who is online, on which item, and who has stalled, per project.
+
+Slots are kept up to date by the progress events of `progress_bus`, so
+reading a persona is a dict lookup and a batch summary only walks its
+participants. A participant without a slot (after a restart, or when the
+project was evicted) is loaded from Mongo on first read.
+"""
+
+
+class Slot:
+    __slots__ = ("state", "battery", "seq", "started", "touched")
+
+    def __init__(self):
+        self.state = None
+        self.battery = None
+        self.seq = None
+        self.started = None
+        self.touched = None
+
+    def apply(self, event: Dict, overwrite: bool = True):
+        """Merge a progress event, `overwrite=False` only fills blanks"""
+        progress = event.get("progress") or {}
+        gpq = event.get("gpq") or {}
+        fields = {
+            "state": progress.get("state"),
+            "battery": progress.get("battery"),
+            "seq": gpq.get("seq"),
+            "started": gpq.get("started"),
+        }
+        for name, value in fields.items():
+            if value is not None and (overwrite or getattr(self, name) is None):
+                setattr(self, name, value)
+        for ts in (progress.get("touched"), gpq.get("touched")):
+            if ts and (self.touched is None or ts > self.touched):
+                self.touched = ts
+
+    def to_dict(self, username: str, now: int):
+        idle = now - self.touched if self.touched else None
+        return {
+            "username": username,
+            "state": self.state,
+            "battery": self.battery,
+            "seq": self.seq,
+            "touched": self.touched,
+            "online": idle is not None and idle < config.PRESENCE_ONLINE_MS,
+            "stalled": bool(self.started) and self.state != "finished"
+                and idle is not None and idle > config.GPQ_STALL_MS,
+        }
+
+
+class PresenceIndex:
+    def __init__(self, max_projects: int):
+        self._projects = LRUCache(maxsize=max_projects)
+
+    def on_event(self, prj_id: str, event: Dict):
+        # Only projects someone has read are indexed
+        slots = self._projects.get(prj_id)
+        if slots is None:
+            return
+        slot = slots.get(event["username"])
+        if slot is not None:
+            slot.apply(event)
+
+    async def _load(self, db: DBClient, prj_id: str, usernames: List[str]):
+        logging.info(f"Loading presence of {len(usernames)} personas")
+        slots = self._projects.setdefault(prj_id, {})
+        # Slots exist before the reads, so events meanwhile are not lost
+        for username in usernames:
+            slots.setdefault(username, Slot())
+        for row in await get_personas_progress(db, prj_id, usernames):
+            slots[row["username"]].apply(row, overwrite=False)
+        for row in await get_gpq_touched(db, prj_id, usernames):
+            slots[row["username"]].apply({"gpq": row}, overwrite=False)
+        return slots
+
+    async def get_slots(self, db: DBClient, prj_id: str, usernames: List[str]):
+        slots = self._projects.get(prj_id) or {}
+        missing = [x for x in usernames if x not in slots]
+        if missing:
+            slots = await self._load(db, prj_id, missing)
+        return {x: slots[x] for x in usernames}
+
+    async def persona(self, db: DBClient, prj_id: str, username: str):
+        slots = await self.get_slots(db, prj_id, [username])
+        return slots[username].to_dict(username, round(time() * 1000))
+
+    async def batch(self, db: DBClient, prj_id: str, usernames: List[str]):
+        """Every participant's slot plus counts for the batch"""
+        now = round(time() * 1000)
+        slots = await self.get_slots(db, prj_id, usernames)
+        personas = [slot.to_dict(x, now) for x, slot in slots.items()]
+        return {
+            "total": len(personas),
+            "online": sum(1 for x in personas if x["online"]),
+            "stalled": sum(1 for x in personas if x["stalled"]),
+            "finished": sum(1 for x in personas if x["state"] == "finished"),
+            "personas": personas,
+        }
+
+
+presence = PresenceIndex(config.PRESENCE_MAX_PROJECTS)
+progress_bus.add_listener(presence.on_event)
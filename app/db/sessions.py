@@ -0,0 +1,141 @@
+import logging
+from typing import Dict, Optional
+
+from cachetools import TTLCache
+
+from app.core import config
+
+# State fields kept as strings, every other field is an int
+TEXT_FIELDS = ("prj_id", "username", "version")
+
+
+class SessionStore:
+    """
+    Short-lived state of running test sessions, keyed by evidence id.
+    A state is a flat dict of int timestamps (`initiated`, `started`,
+    `touched`, `stopped`) plus the evidence's `prj_id`, `username` and `version`. Entries idle
+    for longer than the TTL are dropped, Mongo stays the source of truth.
+    """
+
+    async def get(self, key: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def set(self, key: str, state: Dict):
+        """Merge `state` into the stored state, None values are skipped"""
+        raise NotImplementedError
+
+    async def touch(self, key: str, ts: int) -> Optional[Dict]:
+        """Store `ts` as `touched` and return the previous state"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Per-process LRU with TTL, only consistent within one worker"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str):
+        return self._cache.get(key)
+
+    async def set(self, key: str, state: Dict):
+        current = dict(self._cache.get(key) or {})
+        current.update({k: v for k, v in state.items() if v is not None})
+        # Re-assigning also restarts the entry's TTL
+        self._cache[key] = current
+
+    async def touch(self, key: str, ts: int):
+        previous = self._cache.get(key)
+        self._cache[key] = {**(previous or {}), "touched": ts}
+        return previous
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Shared by every worker on the host, one Redis hash per session.
+    Requires `aioredis` (1.x), which is only needed with this backend.
+    """
+
+    def __init__(self, url: str, ttl: int):
+        try:
+            import aioredis
+        except ImportError:
+            raise RuntimeError(
+                "GPQ_SESSION_STORE=redis needs aioredis 1.x (pip install 'aioredis<2')"
+            )
+        if not hasattr(aioredis, "create_redis_pool"):
+            raise RuntimeError(
+                f"aioredis {aioredis.__version__} is installed, the redis "
+                "session store needs aioredis 1.x"
+            )
+        self._aioredis = aioredis
+        self._url = url
+        self._ttl = ttl
+        self._redis = None
+
+    def _key(self, key: str):
+        return "gpq:session:" + key
+
+    async def _conn(self):
+        if self._redis is None:
+            logging.info("Connecting to session store...")
+            self._redis = await self._aioredis.create_redis_pool(self._url)
+        return self._redis
+
+    def _decode(self, state: Dict):
+        if not state:
+            return None
+        return {
+            k: v if k in TEXT_FIELDS else int(v) for k, v in state.items()
+        }
+
+    async def get(self, key: str):
+        redis = await self._conn()
+        return self._decode(
+            await redis.hgetall(self._key(key), encoding="utf-8")
+        )
+
+    async def set(self, key: str, state: Dict):
+        redis = await self._conn()
+        fields = {k: v for k, v in state.items() if v is not None}
+        tr = redis.multi_exec()
+        if fields:
+            tr.hmset_dict(self._key(key), fields)
+        tr.expire(self._key(key), self._ttl)
+        await tr.execute()
+
+    async def touch(self, key: str, ts: int):
+        redis = await self._conn()
+        tr = redis.multi_exec()
+        tr.hgetall(self._key(key), encoding="utf-8")
+        tr.hset(self._key(key), "touched", ts)
+        tr.expire(self._key(key), self._ttl)
+        previous, _, _ = await tr.execute()
+        return self._decode(previous)
+
+    async def close(self):
+        if self._redis is not None:
+            logging.info("Closing session store connection...")
+            self._redis.close()
+            await self._redis.wait_closed()
+            self._redis = None
+
+
+def create_session_store() -> SessionStore:
+    """Built at import, so a misconfigured store stops the app at startup"""
+    if config.GPQ_SESSION_STORE not in ("memory", "redis"):
+        raise RuntimeError(
+            f"Unknown GPQ_SESSION_STORE {config.GPQ_SESSION_STORE!r}, "
+            "use memory or redis"
+        )
+    if config.GPQ_SESSION_STORE == "redis":
+        return RedisSessionStore(config.REDIS_URL, config.GPQ_SESSION_TTL)
+    return MemorySessionStore(
+        config.GPQ_SESSION_MAXSIZE, config.GPQ_SESSION_TTL
+    )
+
+
+gpq_sessions = create_session_store()
@@ -7,8 +7,16 @@ from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 
 from app.api.api_v1.api import router as api_router
 from app.core import config
-from app.core.errors import http_422_error_handler, http_error_handler
+from app.core.errors import (hash_queue_full_handler, http_422_error_handler,
+                             http_error_handler)
+from app.core.security import HashQueueFull, hasher
+from app.crud.gpq import gpq_writes
+from app.db.itembank import close_banks
 from app.db.mongo import close_connection, connect_to_mongo
+from app.db.sessions import gpq_sessions
+from app.scoring.gpq import gpq_scorer
+from app.scoring.norms import gpq_norms
+from app.scoring.timing import gpq_timing
 
 app = FastAPI(title=config.PROJECT_NAME)
 
@@ -26,14 +34,19 @@ sentry_sdk.init(config.SENTRY_DSN)
 SentryAsgiMiddleware(app)
 
 app.add_event_handler("startup", connect_to_mongo)
+# Buffered GPQ answers must be written before the connection closes
+app.add_event_handler("shutdown", gpq_writes.close)
+app.add_event_handler("shutdown", gpq_timing.close)
+app.add_event_handler("shutdown", gpq_norms.close)
 app.add_event_handler("shutdown", close_connection)
+app.add_event_handler("shutdown", hasher.shutdown)
+app.add_event_handler("shutdown", gpq_sessions.close)
+app.add_event_handler("shutdown", gpq_scorer.shutdown)
+app.add_event_handler("shutdown", close_banks)
 
 # CORS
 origins = []
 
-# GPQ EV STACKS
-# gpq_touch_stacks = {}
-
 # Set all CORS enabled origins
 if config.BACKEND_CORS_ORIGINS:
     origins_raw = config.BACKEND_CORS_ORIGINS.split(",")
@@ -46,8 +59,10 @@ if config.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],
     ),
 
+app.add_exception_handler(HashQueueFull, hash_queue_full_handler)
 # app.add_exception_handler(HTTPException, http_error_handler)
 # app.add_exception_handler(HTTP_422_UNPROCESSABLE_ENTITY, http_422_error_handler)
 
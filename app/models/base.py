@@ -1,4 +1,5 @@
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Any, List, Optional
 
 from pydantic import BaseConfig, BaseModel, EmailStr, Schema, validator
@@ -110,3 +111,39 @@ class Workbook(BaseModel):
     @classmethod
     def validate_type(cls, v):
         return v.upper()
+
+
+def field_paths(model, prefix: str = ""):
+    """Dotted Mongo paths for every leaf field `model` exposes"""
+    paths = []
+    for name, field in model.__fields__.items():
+        path = prefix + (field.alias or name)
+        inner = field.type_
+        if isinstance(inner, type) and issubclass(inner, BaseModel):
+            paths += field_paths(inner, path + ".")
+        else:
+            paths.append(path)
+    return paths
+
+
+@lru_cache(maxsize=256)
+def model_projection(model, fields: str = None):
+    """
+    Mongo projection covering what the response `model` exposes, so
+    nothing else (hashed passwords, internal counters) leaves the database.
+    `fields` is an optional comma separated list of top level names to
+    narrow it further; `_id` is always included.
+    """
+    wanted = None
+    if fields:
+        wanted = {"_id"}
+        for name in fields.split(","):
+            name = name.strip()
+            if name in model.__fields__:
+                name = model.__fields__[name].alias or name
+            wanted.add(name)
+    projection = {"_id": 1}
+    for path in field_paths(model):
+        if wanted is None or path.split(".")[0] in wanted:
+            projection[path] = 1
+    return projection
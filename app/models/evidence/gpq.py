@@ -1,33 +1,170 @@
+import sys
+from array import array
 from datetime import datetime
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 
+from bson.binary import Binary
 from bson.objectid import ObjectId
 from pydantic import Schema, validator
 
-from app.models.dbmodel import BaseModel, DBModel, RWModel
+from app.core.config import GPQ_TOTAL_ITEMS
+from app.models.base import BaseModel, DBModel, RWModel
 
 
 class GPQRow(BaseModel):
     """`saved` & `elapsed` must come from identical time source"""
     seq: int
     wb_seq: int             # nomer urut di workbook
+    option: int = None      # chosen option in the item bank
     element: str = None     # simbol elemen
-    statement: str = None   # Lorem ipsum...
+    statement: str = None   # Lorem ipsum..., from the bank when `option` is set
     saved: int = None       # time when record was saved
     elapsed: int = None     # elapsed time since previous event
 
 
+"""
+Compact layout of `records`: one typed column per GPQRow field instead
+of one sub-document per row. Integers are packed little-endian into BSON
+binary, `element` and `statement` are indices into a per-evidence table
+(0 = empty). Every column keeps its row field name, so projections such
+as `records.element` keep working.
+
+    records: {
+        "seq":       Binary(int16[]),
+        "wb_seq":    Binary(int16[]),
+        "option":    Binary(int16[]),
+        "element":   {"codes": Binary(uint8[]),  "table": ["SN", ...]},
+        "statement": {"codes": Binary(uint16[]), "table": ["...", ...]},
+        "saved":     Binary(int64[]),
+        "elapsed":   Binary(int64[])
+    }
+
+`elapsed` was packed as int32 before, such columns are told apart by
+their size and still decode.
+"""
+INT_COLUMNS = {
+    "seq": "h", "wb_seq": "h", "option": "h", "saved": "q", "elapsed": "q"
+}
+LEGACY_COLUMNS = {"elapsed": "i"}
+TEXT_COLUMNS = {"element": "B", "statement": "H"}
+EMPTY = {"h": -2 ** 15, "i": -2 ** 31, "q": -2 ** 63}
+
+
+def _pack(typecode: str, values: List[int]):
+    data = array(typecode, values)
+    if sys.byteorder == "big":
+        data.byteswap()
+    return Binary(data.tobytes())
+
+
+def _unpack(typecode: str, blob: bytes):
+    data = array(typecode)
+    data.frombytes(bytes(blob))
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tolist()
+
+
+def encode_records(records: List) -> Dict:
+    """Row layout (GPQRow or dicts) to compact layout"""
+    rows = [x.dict() if isinstance(x, BaseModel) else x for x in records]
+    columns = {}
+    for name, typecode in INT_COLUMNS.items():
+        empty = EMPTY[typecode]
+        columns[name] = _pack(typecode, [
+            empty if x.get(name) is None else x[name] for x in rows
+        ])
+    for name, typecode in TEXT_COLUMNS.items():
+        table, index = [], {}
+        codes = []
+        for x in rows:
+            value = x.get(name)
+            if not value:
+                codes.append(0)
+                continue
+            if value not in index:
+                table.append(value)
+                index[value] = len(table)
+            codes.append(index[value])
+        columns[name] = {"codes": _pack(typecode, codes), "table": table}
+    return columns
+
+
+def decode_records(columns: Dict) -> List[Dict]:
+    """Compact layout back to row dicts, missing columns decode as None"""
+    decoded = {}
+    count = len(columns.get("seq") or b"") // 2
+    for name, typecode in INT_COLUMNS.items():
+        if name in columns:
+            legacy = LEGACY_COLUMNS.get(name)
+            if legacy and len(columns[name]) == count * array(legacy).itemsize:
+                typecode = legacy
+            empty = EMPTY[typecode]
+            decoded[name] = [
+                None if v == empty else v
+                for v in _unpack(typecode, columns[name])
+            ]
+    for name, typecode in TEXT_COLUMNS.items():
+        if name in columns:
+            table = [None] + columns[name].get("table", [])
+            decoded[name] = [
+                table[i] for i in _unpack(typecode, columns[name]["codes"])
+            ]
+    count = max([len(x) for x in decoded.values()] or [0])
+    return [
+        {name: values[i] for name, values in decoded.items()}
+        for i in range(count)
+    ]
+
+
+def record_rows(records: Any) -> List[Dict]:
+    """`records` as row dicts whichever layout it is stored in"""
+    if isinstance(records, dict):
+        return decode_records(records)
+    return records or []
+
+
+class GPQAnswers(BaseModel):
+    """
+    Queued answers of one evidence. `saved` of every row and `since` are
+    client timestamps; `since` is the event before the first row (the
+    previous answer or the start).
+    """
+    since: int
+    rows: List[GPQRow]
+
+    @validator("rows")
+    @classmethod
+    def validate_rows(cls, rows):
+        seqs = set()
+        for row in rows:
+            if not 1 <= row.seq <= GPQ_TOTAL_ITEMS or row.saved is None:
+                raise ValueError(
+                    f"Every row needs seq 1..{GPQ_TOTAL_ITEMS} and saved"
+                )
+            if row.seq in seqs:
+                raise ValueError(f"Duplicate seq {row.seq}")
+            seqs.add(row.seq)
+        return rows
+
+
 class GPQEvidenceBase(RWModel):
     prj_id: Optional[Any] = None
-    # version: str = None
+    version: str = None
     username: str = None
     fullname: str = None
     initiated: int = None
     started: int = None
     stopped: int = None
     touched: int = None
+    submitted: int = None   # newest client `saved` of submitted rows
     records: List[GPQRow] = []
 
+    @validator("records", pre=True)
+    @classmethod
+    def validate_records(cls, x):
+        return record_rows(x)
+
 
 class GPQEvidence(GPQEvidenceBase, DBModel):
     oid: Optional[Any] = Schema(..., alias="_id")
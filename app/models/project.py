@@ -28,6 +28,15 @@ class GuestCreate(UserModel, TypedModel):
     password: str
 
 
+class GuestUpdate(BaseModel):
+    fullname: str = None
+    email: EmailStr = None
+    phone: str = None
+    note: str = None
+    disabled: bool = None
+    password: str = None
+
+
 # class GuestInDB(Guest):
 #     hashed_password: str
 
@@ -26,3 +26,25 @@ class RoleEnum(Enum):
 
 class Roles(BaseModel):
     roles: List[RoleEnum]
+
+
+# Bit positions are persisted inside issued tokens, only append new roles.
+ROLE_BITS = [
+    RoleEnum.superuser,
+    RoleEnum.projectcreator,
+    RoleEnum.projectmanager,
+    RoleEnum.projectmember,
+    RoleEnum.licensepublisher,
+]
+
+
+def roles_to_mask(roles: List[str]) -> int:
+    mask = 0
+    for i, role in enumerate(ROLE_BITS):
+        if role.value in (roles or []):
+            mask |= 1 << i
+    return mask
+
+
+def mask_to_roles(mask: int) -> List[str]:
+    return [role.value for i, role in enumerate(ROLE_BITS) if mask & (1 << i)]
@@ -18,3 +18,11 @@ class TokenPayload(BaseModel):
     scope: str = None
     # channel: str = None
     context: str = None
+    # Principal snapshot, absent in tokens issued before claims were added
+    id: str = None
+    fullname: str = None
+    email: str = None
+    type: str = None
+    roles: int = 0
+    disabled: bool = False
+    ver: int = None
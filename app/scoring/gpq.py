@@ -0,0 +1,184 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+from bson.objectid import ObjectId
+from cachetools import LRUCache
+
+from app.core import config
+from app.crud import utils as crudutils
+from app.db.mongo import AsyncIOMotorClient as DBClient
+from app.models.evidence.gpq import record_rows
+
+# Answers faster than this (ms) count as "fast" in the features
+FAST_ANSWER_MS = 2000
+
+
+def to_columns(evidences: List[Dict]):
+    """
+    Flatten answered records of many evidences into parallel arrays:
+    owner index, element code (categorical int), wb_seq and elapsed.
+    Unanswered rows (no element) are dropped.
+    """
+    owners, elements, wb_seqs, elapsed = [], [], [], []
+    for i, ev in enumerate(evidences):
+        for row in record_rows(ev.get("records")):
+            if not row.get("element"):
+                continue
+            owners.append(i)
+            elements.append(row["element"])
+            wb_seqs.append(row.get("wb_seq") or 0)
+            elapsed.append(row.get("elapsed") or 0)
+    names, codes = np.unique(np.array(elements, dtype=str), return_inverse=True)
+    return (
+        np.array(owners, dtype=np.int64),
+        codes.astype(np.int64),
+        names.tolist(),
+        np.array(wb_seqs, dtype=np.int64),
+        np.array(elapsed, dtype=np.float64),
+    )
+
+
+def score_columns(count: int, owners, codes, names: List[str], wb_seqs,
+elapsed):
+    """
+    One vectorized pass over the columns of `count` evidences.
+    Returns per evidence the element tally and response-time features.
+    """
+    tally = np.zeros((count, len(names)), dtype=np.int64)
+    np.add.at(tally, (owners, codes), 1)
+
+    answered = np.bincount(owners, minlength=count)
+    total = np.bincount(owners, weights=elapsed, minlength=count)
+    squares = np.bincount(owners, weights=elapsed ** 2, minlength=count)
+    fast = np.bincount(
+        owners, weights=(elapsed < FAST_ANSWER_MS), minlength=count
+    )
+    # Trend: least-squares slope of elapsed over workbook position
+    x = wb_seqs.astype(np.float64)
+    sx = np.bincount(owners, weights=x, minlength=count)
+    sxx = np.bincount(owners, weights=x * x, minlength=count)
+    sxy = np.bincount(owners, weights=x * elapsed, minlength=count)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(answered > 0, total / answered, 0)
+        std = np.sqrt(np.maximum(
+            np.where(answered > 0, squares / answered, 0) - mean ** 2, 0
+        ))
+        denom = answered * sxx - sx ** 2
+        trend = np.where(denom > 0, (answered * sxy - sx * total) / denom, 0)
+
+    # Median: sort by (owner, elapsed), then pick the middle of each run
+    order = np.lexsort((elapsed, owners))
+    ordered = elapsed[order]
+    starts = np.concatenate(([0], np.cumsum(answered)[:-1]))
+    lo = starts + (answered - 1) // 2
+    hi = starts + answered // 2
+    median = np.zeros(count)
+    has = answered > 0
+    median[has] = (ordered[lo[has]] + ordered[hi[has]]) / 2
+
+    scores = []
+    for i in range(count):
+        scores.append({
+            "elements": {
+                names[j]: int(tally[i, j]) for j in np.flatnonzero(tally[i])
+            },
+            "answered": int(answered[i]),
+            "elapsed_mean": round(float(mean[i]), 1),
+            "elapsed_median": round(float(median[i]), 1),
+            "elapsed_std": round(float(std[i]), 1),
+            "fast_answers": int(fast[i]),
+            "elapsed_trend": round(float(trend[i]), 2),
+        })
+    return scores
+
+
+def score_evidences(evidences: List[Dict]):
+    """Runs in the pool, so it takes and returns plain data"""
+    owners, codes, names, wb_seqs, elapsed = to_columns(evidences)
+    return score_columns(
+        len(evidences), owners, codes, names, wb_seqs, elapsed
+    )
+
+
+class GPQScorer:
+    """
+    Scores a project's GPQ evidences.
+
+    Results are cached per evidence and keyed by its `touched`, so only
+    evidences answered since the last call are read and scored again.
+    Large projects are split in chunks of `chunk` evidences and scored on
+    a process pool of `workers` (0 scores on the event loop's thread pool).
+    """
+
+    def __init__(self, workers: int, chunk: int, cache_size: int):
+        self.workers = workers
+        self.chunk = chunk
+        self._executor = None
+        self._cache = LRUCache(maxsize=cache_size)
+
+    def _get_executor(self):
+        if self._executor is None and self.workers > 0:
+            logging.info(f"Starting scoring pool with {self.workers} workers")
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _score(self, evidences: List[Dict]):
+        loop = asyncio.get_event_loop()
+        chunks = [
+            evidences[i:i + self.chunk]
+            for i in range(0, len(evidences), self.chunk)
+        ]
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self._get_executor(), score_evidences, x)
+            for x in chunks
+        ])
+        return [score for chunk in results for score in chunk]
+
+    async def score_project(self, db: DBClient, prj_id: str):
+        logging.info(f">>> {__name__}:{self.score_project.__name__}")
+        collection = crudutils.get_collection(db, config.DOCTYPE_EV_GPQ)
+        heads = []
+        async for row in collection.find(
+            {"prj_id": ObjectId(prj_id)},
+            {"username": 1, "touched": 1}
+        ):
+            heads.append(row)
+
+        stale = [
+            x["_id"] for x in heads
+            if self._cache.get(x["_id"], (None,))[0] != x.get("touched")
+        ]
+        if stale:
+            evidences = []
+            async for row in collection.find(
+                {"_id": {"$in": stale}},
+                {"touched": 1, "records.element": 1, "records.wb_seq": 1,
+                 "records.elapsed": 1}
+            ):
+                evidences.append(row)
+            logging.info(f"Scoring {len(evidences)} of {len(heads)} evidences")
+            scores = await self._score(evidences)
+            for ev, score in zip(evidences, scores):
+                self._cache[ev["_id"]] = (ev.get("touched"), score)
+
+        rs = []
+        for x in heads:
+            cached = self._cache.get(x["_id"])
+            if cached:
+                rs.append({"username": x["username"], **cached[1]})
+        return rs
+
+    async def shutdown(self):
+        if self._executor is not None:
+            logging.info("Shutting down scoring pool...")
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+gpq_scorer = GPQScorer(
+    config.GPQ_SCORING_WORKERS, config.GPQ_SCORING_CHUNK,
+    config.GPQ_SCORING_CACHE
+)
@@ -0,0 +1,135 @@
+import logging
+from typing import Dict, List
+
+from bson.objectid import ObjectId
+from cachetools import LRUCache, TTLCache
+
+from app.core import config
+from app.crud import utils as crudutils
+from app.db.mongo import AsyncIOMotorClient as DBClient
+
+"""
+GPQ norm tables: per element, how many finished personas chose it N
+times, at project, company and global scope.
+
+A raw score is a small integer (0..GPQ_TOTAL_ITEMS), so the sketch of an
+element is simply the count per score. It is exact, merges by adding
+counts, and a finished evidence updates it with one `$inc`. Zero scores
+are not stored, they are `count` minus the stored counts.
+
+    {"_id": "project:<id>" | "company:<id>" | "global",
+     "count": 812, "elements": {"SN": {"7": 40, "8": 52, ...}, ...}}
+"""
+
+SCOPES = ("project", "company", "global")
+
+
+def element_tally(rows: List[Dict]):
+    tally = {}
+    for row in rows:
+        if row.get("element"):
+            tally[row["element"]] = tally.get(row["element"], 0) + 1
+    return tally
+
+
+def norm_key(scope: str, key: str = None):
+    return "global" if scope == "global" else f"{scope}:{key}"
+
+
+class NormTable:
+    """Cumulative counts of one scope, for O(1) percentile lookups"""
+
+    def __init__(self, doc: Dict):
+        self.count = doc.get("count", 0)
+        self.cumulative = {}
+        for element, buckets in (doc.get("elements") or {}).items():
+            counts = [0] * (config.GPQ_TOTAL_ITEMS + 1)
+            for score, n in buckets.items():
+                counts[min(int(score), config.GPQ_TOTAL_ITEMS)] += n
+            counts[0] += self.count - sum(counts)
+            running, cumulative = 0, []
+            for n in counts:
+                running += n
+                cumulative.append(running)
+            self.cumulative[element] = cumulative
+
+    def percentile(self, element: str, score: int):
+        """Mid-rank percentile of `score` among this scope's personas"""
+        if not self.count:
+            return None
+        score = max(0, min(score, config.GPQ_TOTAL_ITEMS))
+        cumulative = self.cumulative.get(element)
+        if cumulative is None:
+            # Nobody chose the element, every persona scored 0
+            below, upto = 0, self.count
+            if score > 0:
+                below = upto
+        else:
+            below = cumulative[score - 1] if score > 0 else 0
+            upto = cumulative[score]
+        return round(100 * (below + upto) / 2 / self.count, 1)
+
+    def percentiles(self, profile: Dict[str, int]):
+        return {x: self.percentile(x, score) for x, score in profile.items()}
+
+
+class GPQNorms:
+    """
+    Keeps the norm tables up to date as evidences finish. Increments go
+    through write-behind batching, tables are read through a short TTL
+    cache of this worker.
+
+    Tables are eventually consistent: `record` only drops this worker's
+    cached tables, other workers keep serving theirs until the TTL runs
+    out. A percentile can lag finished evidences by up to `cache_ttl`
+    plus one flush interval.
+    """
+
+    def __init__(self, max_rows: int, interval_ms: int, cache_ttl: int):
+        self._writes = crudutils.WriteBehind(
+            config.DOCTYPE_GPQ_NORMS, max_rows, interval_ms, upsert=True
+        )
+        self._tables = TTLCache(maxsize=10000, ttl=cache_ttl)
+        self._companies = LRUCache(maxsize=10000)
+
+    async def company_of(self, db: DBClient, prj_id: str):
+        if prj_id not in self._companies:
+            collection = crudutils.get_collection(db, config.DOCTYPE_PROJECT)
+            project = await collection.find_one(
+                {"_id": ObjectId(prj_id)}, {"_id": 0, "client_id": 1}
+            )
+            self._companies[prj_id] = (project or {}).get("client_id")
+        return self._companies[prj_id]
+
+    async def record(self, db: DBClient, prj_id: str, tally: Dict[str, int]):
+        """Add one finished persona's element tally to its three scopes"""
+        logging.info(f">>> {__name__}:{self.record.__name__}")
+        inc = {"count": 1}
+        for element, score in tally.items():
+            if score > 0:
+                inc[f"elements.{element}.{score}"] = 1
+        company = await self.company_of(db, prj_id)
+        keys = [norm_key("project", prj_id), norm_key("global")]
+        if company:
+            keys.append(norm_key("company", str(company)))
+        for key in keys:
+            self._tables.pop(key, None)
+            await self._writes.add_update(key, {"$inc": inc})
+
+    async def get_table(self, db: DBClient, scope: str, key: str = None):
+        id = norm_key(scope, key)
+        table = self._tables.get(id)
+        if table is None:
+            collection = crudutils.get_collection(db, config.DOCTYPE_GPQ_NORMS)
+            doc = await collection.find_one({"_id": id})
+            table = NormTable(doc or {})
+            self._tables[id] = table
+        return table
+
+    async def close(self):
+        await self._writes.close()
+
+
+gpq_norms = GPQNorms(
+    config.GPQ_FLUSH_ROWS, config.GPQ_FLUSH_MS, config.GPQ_NORMS_CACHE_TTL
+)
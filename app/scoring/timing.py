@@ -0,0 +1,144 @@
+import logging
+from bisect import bisect_right
+from time import time
+from typing import Dict, List
+
+from bson.objectid import ObjectId
+
+from app.core import config
+from app.crud import utils as crudutils
+from app.db.mongo import AsyncIOMotorClient as DBClient
+
+"""
+Response-time histograms, kept up to date as answers land.
+
+One document per project item (`kind: "item"`), per project (`"project"`)
+and per persona (`"persona"`) in the gpq_timing collection. Histogram
+buckets are log-spaced, so two histograms merge by adding counts and the
+increments of many answers can be coalesced into one `$inc`.
+"""
+
+# Upper bounds (ms) of the buckets: 50 ms growing by 25% up to ~30 min
+BOUNDS = [round(50 * 1.25 ** k) for k in range(48)]
+QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+
+def bucket_of(elapsed: int):
+    return min(bisect_right(BOUNDS, max(elapsed, 0)), len(BOUNDS) - 1)
+
+
+def quantile(buckets: Dict, count: int, q: float):
+    """Approximate quantile: geometric middle of the bucket holding it"""
+    if not count:
+        return None
+    rank = q * count
+    seen = 0
+    for k in sorted(int(x) for x in buckets):
+        seen += buckets[str(k)]
+        if seen >= rank:
+            low = BOUNDS[k - 1] if k > 0 else 0
+            return round((max(low, 1) * BOUNDS[k]) ** 0.5)
+    return BOUNDS[-1]
+
+
+def summary(doc: Dict):
+    count = doc.get("count", 0)
+    rs = {"count": count}
+    for name, q in QUANTILES.items():
+        rs[name] = quantile(doc.get("buckets", {}), count, q)
+    return rs
+
+
+class ResponseTimes:
+    """
+    Buffers histogram increments per worker and writes them with the
+    same write-behind batching as GPQ answers.
+    """
+
+    def __init__(self, max_rows: int, interval_ms: int):
+        self._writes = crudutils.WriteBehind(
+            config.DOCTYPE_GPQ_TIMING, max_rows, interval_ms, upsert=True
+        )
+
+    async def record(self, prj_id: str, username: str, wb_seq: int,
+    elapsed: int, saved: int):
+        if elapsed is None:
+            return
+        hit = {"count": 1, "sum": elapsed, "buckets." + str(bucket_of(elapsed)): 1}
+        head = {"prj_id": ObjectId(prj_id)}
+        await self._writes.add_update(f"{prj_id}:item:{wb_seq}", {
+            "$inc": hit,
+            "$set": {**head, "kind": "item", "wb_seq": wb_seq}
+        })
+        await self._writes.add_update(f"{prj_id}:project", {
+            "$inc": hit,
+            "$set": {**head, "kind": "project"}
+        })
+        await self._writes.add_update(f"{prj_id}:persona:{username}", {
+            "$inc": {
+                "count": 1,
+                "sum": elapsed,
+                "fast": 1 if elapsed < config.GPQ_RUSH_MS else 0
+            },
+            "$max": {"last": saved},
+            "$set": {**head, "kind": "persona", "username": username}
+        })
+
+    async def report(self, db: DBClient, prj_id: str):
+        """Quantiles per item and for the project, plus persona flags"""
+        logging.info(f">>> {__name__}:{self.report.__name__}")
+        collection = crudutils.get_collection(db, config.DOCTYPE_GPQ_TIMING)
+        items, personas, project = [], [], {}
+        async for doc in collection.find({"prj_id": ObjectId(prj_id)}):
+            if doc["kind"] == "item":
+                items.append({"wb_seq": doc["wb_seq"], **summary(doc)})
+            elif doc["kind"] == "project":
+                project = summary(doc)
+            else:
+                personas.append(doc)
+        items.sort(key=lambda x: x["wb_seq"])
+        return {
+            "project": project,
+            "items": items,
+            "flags": self.flag_personas(personas, project)
+        }
+
+    def flag_personas(self, personas: List[Dict], project: Dict):
+        """
+        rushed: a large share of answers under GPQ_RUSH_MS
+        slow:   mean answer time above the project's p90
+        stalled: unfinished and no answer for GPQ_STALL_MS
+        """
+        now = round(time() * 1000)
+        flagged = []
+        for doc in personas:
+            count = doc.get("count", 0)
+            if not count:
+                continue
+            mean = doc.get("sum", 0) / count
+            fast_share = doc.get("fast", 0) / count
+            idle = now - doc.get("last", now)
+            flags = []
+            if count >= config.GPQ_RUSH_MIN_ANSWERS and \
+                fast_share >= config.GPQ_RUSH_SHARE:
+                flags.append("rushed")
+            if project.get("p90") and mean > project["p90"]:
+                flags.append("slow")
+            if count < config.GPQ_TOTAL_ITEMS and idle > config.GPQ_STALL_MS:
+                flags.append("stalled")
+            if flags:
+                flagged.append({
+                    "username": doc["username"],
+                    "answered": count,
+                    "mean": round(mean),
+                    "fast_share": round(fast_share, 2),
+                    "idle": idle,
+                    "flags": flags
+                })
+        return flagged
+
+    async def close(self):
+        await self._writes.close()
+
+
+gpq_timing = ResponseTimes(config.GPQ_FLUSH_ROWS, config.GPQ_FLUSH_MS)
@@ -0,0 +1,118 @@
+"""
+Row vs compact layout of GPQ evidence records, with statement text and
+with answers by item bank option (element code only).
+
+    python -m bench.gpq_layout [personas]
+
+Prints BSON size per evidence and encode/decode cost. With MONGODB_URI
+and MONGODB_NAME set, also times insert and read of `personas` evidences
+in a scratch collection that is dropped afterwards.
+"""
+import os
+import random
+import sys
+from time import perf_counter
+
+import bson
+from bson.objectid import ObjectId
+
+from app.core.config import GPQ_TOTAL_ITEMS
+from app.models.evidence.gpq import decode_records, encode_records
+
+ELEMENTS = ["SN", "PA", "EX", "CO", "OP", "AG", "NE", "RE"]
+STATEMENTS = [
+    "Saya lebih suka menyelesaikan pekerjaan sebelum tenggat waktu %d" % i
+    for i in range(GPQ_TOTAL_ITEMS)
+]
+
+
+def sample_evidence():
+    seqs = list(range(1, GPQ_TOTAL_ITEMS + 1))
+    random.shuffle(seqs)
+    saved = 1586143502687
+    records = []
+    for i in range(GPQ_TOTAL_ITEMS):
+        elapsed = random.randint(800, 25000)
+        saved += elapsed
+        records.append({
+            "seq": i + 1,
+            "wb_seq": seqs[i],
+            "option": random.randint(0, 1),
+            "element": random.choice(ELEMENTS),
+            "statement": STATEMENTS[seqs[i] - 1],
+            "saved": saved,
+            "elapsed": elapsed,
+        })
+    return {
+        "_id": ObjectId(),
+        "prj_id": ObjectId(),
+        "username": "persona%d" % random.randint(1, 9999),
+        "fullname": "Persona",
+        "touched": saved,
+        "records": records,
+    }
+
+
+def timed(fn, repeat: int):
+    start = perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (perf_counter() - start) * 1000 / repeat
+
+
+def report(name: str, doc: dict, repeat: int):
+    raw = bson.encode(doc)
+    print("%-8s size %6d B   bson encode %.3f ms   decode %.3f ms" % (
+        name, len(raw),
+        timed(lambda: bson.encode(doc), repeat),
+        timed(lambda: bson.decode(raw), repeat),
+    ))
+
+
+def bench_mongo(rows: list, compact: list):
+    from pymongo import MongoClient
+    db = MongoClient(os.getenv("MONGODB_URI"))[os.getenv("MONGODB_NAME")]
+    for name, docs in (("rows", rows), ("compact", compact)):
+        collection = db["bench_gpq_" + name]
+        collection.drop()
+        start = perf_counter()
+        collection.insert_many(docs)
+        insert_ms = (perf_counter() - start) * 1000
+        start = perf_counter()
+        count = len(list(collection.find({})))
+        read_ms = (perf_counter() - start) * 1000
+        print("%-8s insert %d: %.1f ms   read: %.1f ms" % (
+            name, count, insert_ms, read_ms
+        ))
+        collection.drop()
+
+
+def main():
+    personas = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    random.seed(7)
+    rows = [sample_evidence() for _ in range(personas)]
+    compact = [{**x, "records": encode_records(x["records"])} for x in rows]
+    assert decode_records(compact[0]["records"]) == rows[0]["records"]
+
+    report("rows", rows[0], 1000)
+    report("compact", compact[0], 1000)
+    banked = {**rows[0], "records": [
+        {k: v for k, v in x.items() if k != "statement"}
+        for x in rows[0]["records"]
+    ]}
+    report("bank", banked, 1000)
+    report("bank+c", {
+        **banked, "records": encode_records(banked["records"])
+    }, 1000)
+    records = rows[0]["records"]
+    packed = compact[0]["records"]
+    print("codec    encode_records %.3f ms   decode_records %.3f ms" % (
+        timed(lambda: encode_records(records), 1000),
+        timed(lambda: decode_records(packed), 1000),
+    ))
+    if os.getenv("MONGODB_URI") and os.getenv("MONGODB_NAME"):
+        bench_mongo(rows, compact)
+
+
+if __name__ == "__main__":
+    main()
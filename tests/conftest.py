@@ -0,0 +1,107 @@
+import pytest
+from bson.objectid import ObjectId
+from starlette.testclient import TestClient
+
+from app.api import security
+from app.core.config import API_V1_STR, USERTYPE_EXPERT, USERTYPE_PERSONA
+from app.crud import gpq
+from app.crud import utils as crudutils
+from app.db.sessions import MemorySessionStore
+from app.main import app
+from tests.fakes import FakeCollection
+
+PRJ_ID = "5e870e7d4c789fb7d8301909"
+BATCH_ID = "batch1"
+EV_ID = ObjectId()
+
+
+def make_user(username: str, scope: str, context: str = PRJ_ID):
+    return {
+        "username": username,
+        "scope": scope,
+        "context": context,
+        "type": scope,
+        "roles": 0,
+        "disabled": False,
+    }
+
+
+@pytest.fixture
+def project(monkeypatch):
+    """The project `ProjectLoader` reads, without Mongo"""
+    doc = {
+        "_id": ObjectId(PRJ_ID),
+        "lead_by": "lead",
+        "batches": [{
+            "batch_id": BATCH_ID,
+            "participants": ["persona1", "persona2"],
+        }],
+    }
+
+    async def load(db, id, projection=None):
+        return doc if id == PRJ_ID else None
+
+    monkeypatch.setattr(security, "load_project", load)
+    return doc
+
+
+@pytest.fixture
+def login():
+    """`login(user)` makes `user` the principal of every request"""
+    def _login(user: dict):
+        app.dependency_overrides[security.get_current_user] = lambda: user
+
+    yield _login
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def persona(login):
+    user = make_user("persona1", USERTYPE_PERSONA)
+    login(user)
+    return user
+
+
+@pytest.fixture
+def expert(login):
+    user = make_user("expert1", USERTYPE_EXPERT)
+    login(user)
+    return user
+
+
+@pytest.fixture
+def client():
+    # No `with`: startup handlers (Mongo) are not run
+    return TestClient(app)
+
+
+def project_url(path: str):
+    return f"{API_V1_STR}/projects/{PRJ_ID}{path}"
+
+
+@pytest.fixture
+def evidences(monkeypatch):
+    """One running GPQ evidence of 3 rows, direct writes, fresh sessions"""
+    fake = FakeCollection([{
+        "_id": EV_ID,
+        "prj_id": ObjectId(PRJ_ID),
+        "username": "persona1",
+        "version": "1",
+        "stopped": None,
+        "records": gpq.template_records(PRJ_ID, "persona1", "1", 3),
+    }])
+
+    async def record(*args):
+        pass
+
+    monkeypatch.setattr(crudutils, "get_collection", lambda db, doc_type: fake)
+    monkeypatch.setattr(gpq, "GPQ_WRITE_MODE", "direct")
+    monkeypatch.setattr(gpq, "gpq_sessions", MemorySessionStore(100, 3600))
+    monkeypatch.setattr(gpq.gpq_norms, "record", record)
+    monkeypatch.setattr(gpq.gpq_timing, "record", record)
+    return fake
+
+
+def restart(monkeypatch):
+    """Lose every session state, as after eviction or a worker restart"""
+    monkeypatch.setattr(gpq, "gpq_sessions", MemorySessionStore(100, 3600))
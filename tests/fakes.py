@@ -0,0 +1,132 @@
+import copy
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+"""
+An in-memory stand-in for the few Motor collection calls the crud layer
+makes. Filters support equality (None also matches a missing field),
+`$type: "array"`, `$in` and `$ne`; updates `$set` (dotted paths, array
+indices included), `$max`, `$inc` and `$setOnInsert`. Projections are
+ignored, whole documents are returned.
+"""
+
+
+def _get(doc, path):
+    for key in path.split("."):
+        if isinstance(doc, list) and key.isdigit():
+            doc = doc[int(key)] if int(key) < len(doc) else None
+        elif isinstance(doc, dict):
+            doc = doc.get(key)
+        else:
+            return None
+    return doc
+
+
+def _set(doc, path, value):
+    keys = path.split(".")
+    for key in keys[:-1]:
+        doc = doc[int(key)] if isinstance(doc, list) else doc.setdefault(key, {})
+    if isinstance(doc, list):
+        doc[int(keys[-1])] = value
+    else:
+        doc[keys[-1]] = value
+
+
+def _match(doc, filter):
+    for path, cond in filter.items():
+        value = _get(doc, path)
+        if isinstance(cond, dict):
+            if "$type" in cond and not isinstance(value, list):
+                return False
+            if "$in" in cond and value not in cond["$in"]:
+                return False
+            if "$ne" in cond and value == cond["$ne"]:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class FakeResult:
+    def __init__(self, matched=0, upserted=0):
+        self.matched_count = matched
+        self.modified_count = matched
+        self.upserted_count = upserted
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = {doc["_id"]: copy.deepcopy(doc) for doc in docs}
+
+    def _apply(self, doc, update, inserted=False):
+        for path, value in update.get("$set", {}).items():
+            _set(doc, path, copy.deepcopy(value))
+        for path, value in update.get("$max", {}).items():
+            current = _get(doc, path)
+            if current is None or value > current:
+                _set(doc, path, value)
+        for path, value in update.get("$inc", {}).items():
+            _set(doc, path, (_get(doc, path) or 0) + value)
+        if inserted:
+            for path, value in update.get("$setOnInsert", {}).items():
+                _set(doc, path, copy.deepcopy(value))
+
+    def _update(self, filter, update, upsert=False):
+        for doc in self.docs.values():
+            if _match(doc, filter):
+                self._apply(doc, update)
+                return doc, FakeResult(matched=1)
+        if not upsert:
+            return None, FakeResult()
+        id = filter["_id"]
+        if id in self.docs:
+            raise DuplicateKeyError("E11000 duplicate key")
+        doc = {"_id": id}
+        self._apply(doc, update, inserted=True)
+        self.docs[id] = doc
+        return doc, FakeResult(upserted=1)
+
+    async def find_one(self, filter, projection=None):
+        for doc in self.docs.values():
+            if _match(doc, filter):
+                return copy.deepcopy(doc)
+        return None
+
+    def find(self, filter, projection=None):
+        return FakeCursor([
+            copy.deepcopy(x) for x in self.docs.values() if _match(x, filter)
+        ])
+
+    async def update_one(self, filter, update, upsert=False):
+        return self._update(filter, update, upsert)[1]
+
+    async def find_one_and_update(self, filter, update, projection=None,
+    return_document=ReturnDocument.BEFORE, upsert=False):
+        before = await self.find_one(filter)
+        doc, _ = self._update(filter, update, upsert)
+        if doc is None:
+            return None
+        return copy.deepcopy(doc) if return_document else before
+
+    async def bulk_write(self, requests, ordered=True):
+        matched = upserted = 0
+        for op in requests:
+            _, rs = self._update(op._filter, op._doc, op._upsert)
+            matched += rs.matched_count
+            upserted += rs.upserted_count
+        return FakeResult(matched, upserted)
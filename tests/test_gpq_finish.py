@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.crud import gpq
+from app.crud import utils as crudutils
+from app.models.evidence.gpq import GPQAnswers
+from tests.conftest import EV_ID, restart
+
+
+def test_no_answer_after_finish_and_restart(evidences, monkeypatch):
+    id = str(EV_ID)
+
+    async def main():
+        await gpq.init(None, id)
+        await gpq.update(None, id, 1, 1, "SN", "Lorem ipsum")
+        assert await gpq.finish(None, id)
+        restart(monkeypatch)
+        await gpq.init(None, id)
+        with pytest.raises(ValueError):
+            await gpq.update(None, id, 2, 2, "SN", "Lorem ipsum")
+        with pytest.raises(ValueError):
+            await gpq.submit(None, id, GPQAnswers(since=1, rows=[
+                {"seq": 3, "wb_seq": 3, "element": "SN", "saved": 2}
+            ]))
+
+    asyncio.run(main())
+    records = evidences.docs[EV_ID]["records"]
+    assert records[0]["element"] == "SN"
+    assert records[1]["element"] is None
+    assert records[2]["element"] is None
+
+
+def test_unwritten_answers_are_not_timed(evidences, monkeypatch):
+    id = str(EV_ID)
+    timed, events = [], []
+
+    async def record(*args):
+        timed.append(args)
+
+    monkeypatch.setattr(gpq, "GPQ_WRITE_MODE", "flushed")
+    monkeypatch.setattr(gpq, "gpq_writes", crudutils.WriteBehind(
+        "ev", 100, 10, filter=gpq.RUNNING
+    ))
+    monkeypatch.setattr(crudutils, "get_database", lambda: None)
+    monkeypatch.setattr(gpq.gpq_timing, "record", record)
+    monkeypatch.setattr(gpq, "notify", lambda state, fields: events.append(fields))
+
+    async def main():
+        await gpq.init(None, id)
+        assert await gpq.update(None, id, 1, 1, "SN", "Lorem ipsum")
+        # Finished by another worker, this one's session does not know
+        evidences.docs[EV_ID]["stopped"] = 1586143514002
+        assert await gpq.update(None, id, 2, 2, "SN", "Lorem ipsum") is None
+
+    asyncio.run(main())
+    assert [x[2] for x in timed] == [1]
+    assert [x.get("seq") for x in events if "seq" in x] == [1]
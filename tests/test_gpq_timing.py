@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from app.crud import gpq
+from app.crud import utils as crudutils
+from app.models.evidence.gpq import GPQAnswers
+from tests.conftest import EV_ID, restart
+
+ANSWERS = {"since": 1000, "rows": [
+    {"seq": 1, "wb_seq": 1, "element": "SN", "saved": 2000},
+    {"seq": 2, "wb_seq": 2, "element": "SN", "saved": 3500},
+]}
+
+
+@pytest.mark.parametrize("mode", ["direct", "flushed"])
+def test_replay_after_restart_is_not_timed_again(evidences, monkeypatch,
+mode):
+    id = str(EV_ID)
+    timed = []
+
+    async def record(*args):
+        timed.append(args)
+
+    monkeypatch.setattr(gpq, "GPQ_WRITE_MODE", mode)
+    monkeypatch.setattr(gpq, "gpq_writes", crudutils.WriteBehind(
+        "ev", 100, 10, filter=gpq.RUNNING
+    ))
+    monkeypatch.setattr(crudutils, "get_database", lambda: None)
+    monkeypatch.setattr(gpq.gpq_timing, "record", record)
+
+    async def main():
+        await gpq.init(None, id)
+        assert await gpq.submit(None, id, GPQAnswers(**ANSWERS))
+        restart(monkeypatch)
+        assert await gpq.submit(None, id, GPQAnswers(**ANSWERS))
+
+    asyncio.run(main())
+    assert [x[2] for x in timed] == [1, 2]
+    assert evidences.docs[EV_ID]["submitted"] == 3500
@@ -0,0 +1,21 @@
+from tests.conftest import BATCH_ID, project_url
+
+
+def test_persona_cannot_read_batch_feed(client, project, persona):
+    rs = client.get(project_url(f"/batches/{BATCH_ID}/feed"))
+    assert rs.status_code == 403
+
+
+def test_feed_of_unknown_batch_is_404_for_staff(client, project, expert):
+    rs = client.get(project_url("/batches/nope/feed"))
+    assert rs.status_code == 404
+
+
+def test_persona_cannot_read_batch_presence(client, project, persona):
+    rs = client.get(project_url(f"/batches/{BATCH_ID}/presence"))
+    assert rs.status_code == 403
+
+
+def test_persona_cannot_read_persona_presence(client, project, persona):
+    rs = client.get(project_url("/personas/persona2/presence"))
+    assert rs.status_code == 403
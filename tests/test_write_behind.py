@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from bson.objectid import ObjectId
+
+from app.crud import utils as crudutils
+from tests.fakes import FakeCollection
+
+RUNNING = {"_id": ObjectId(), "stopped": None, "n": 0}
+STOPPED = {"_id": ObjectId(), "stopped": 1586143514002, "n": 0}
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    fake = FakeCollection([RUNNING, STOPPED])
+    monkeypatch.setattr(crudutils, "get_database", lambda: None)
+    monkeypatch.setattr(crudutils, "get_collection", lambda db, doc_type: fake)
+    return fake
+
+
+def writer():
+    return crudutils.WriteBehind("ev", 100, 1000, filter={"stopped": None})
+
+
+def test_flush_writes_matched_updates(collection):
+    async def main():
+        wb = writer()
+        await wb.add(str(RUNNING["_id"]), {"n": 1})
+        return await wb.flush()
+
+    assert asyncio.run(main()) is True
+    assert collection.docs[RUNNING["_id"]]["n"] == 1
+
+
+def test_update_not_matching_filter_is_failed(collection):
+    async def main():
+        wb = writer()
+        waited = asyncio.ensure_future(
+            wb.add(str(STOPPED["_id"]), {"n": 1}, wait=True)
+        )
+        await asyncio.sleep(0)
+        await wb.add(str(RUNNING["_id"]), {"n": 1})
+        flushed = await wb.flush()
+        return flushed, await waited
+
+    flushed, acked = asyncio.run(main())
+    assert flushed is False
+    assert acked is False
+    assert collection.docs[STOPPED["_id"]]["n"] == 0
+    assert collection.docs[RUNNING["_id"]]["n"] == 1
+
+
+def test_doc_id_only_converts_24_hex_strings():
+    oid = ObjectId()
+    assert crudutils.doc_id(str(oid)) == oid
+    assert crudutils.doc_id(oid) == oid
+    assert crudutils.doc_id("project:abc") == "project:abc"
+    assert crudutils.doc_id("abcdefghijkl") == "abcdefghijkl"
+    assert crudutils.doc_id("z" * 24) == "z" * 24
+
+
+def test_twelve_character_key_stays_a_string(collection):
+    key = "abcdefghijkl"
+    collection.docs[key] = {"_id": key, "stopped": None, "n": 0}
+
+    async def main():
+        wb = writer()
+        await wb.add(key, {"n": 1})
+        return await wb.flush()
+
+    assert asyncio.run(main()) is True
+    assert collection.docs[key]["n"] == 1
+    assert ObjectId(key.encode()) not in collection.docs